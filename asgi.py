@@ -0,0 +1,16 @@
+# asgi.py
+# Production entry point for DJ AI: serve the Quart app with a real ASGI
+# server instead of the app.run() dev server.
+#
+# SETUP:
+#   pip install hypercorn
+#
+# RUN:
+#   hypercorn asgi:app --bind 0.0.0.0:5000 --keep-alive 75
+#
+# Use ONE worker (no -w N): mix jobs and their progress live in server.py's
+# memory, so a second worker could not answer /mix/status for the first.
+# Concurrency comes from the event loop, the analyze thread pool and the
+# MIX_EXECUTOR process pool instead.
+
+from server import app  # noqa: F401
@@ -24,13 +24,11 @@ _here = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, _here)
 sys.path.insert(0, os.path.join(_here, "sections"))
 
-from get_bpm import get_bpm
-from sections.get_chorus import find_chorus
-from sections.get_verse  import find_verse
 from many_transitions import (
     BPM_TIGHT_THRESHOLD,
     BPM_LOOSE_THRESHOLD,
-    get_key,
+    SongAnalysis,
+    analyse_songs,
     keys_compatible,
     make_transition,
 )
@@ -59,32 +57,25 @@ def _song_stem(path: str) -> str:
     return os.path.splitext(os.path.basename(path))[0]
 
 
-def _transition_timestamp(mode: str, song1_path: str, bpm1: float) -> float:
+def _transition_timestamp(mode: str, song1: SongAnalysis) -> float:
     """Return approximate transition-start time (seconds) for filename labelling."""
-    try:
-        chorus1 = find_chorus(song1_path)
-        if not chorus1:
-            return 0.0
-
-        if mode == "loop":
-            # Composite section starts at end of Song 1 Chorus 1
-            return chorus1[0][1]
-
-        if mode == "tight":
-            # Transition window opens at Song 1 Chorus 1 start
-            return chorus1[0][0]
-
-        # Loose — transition anchored to Song 1 Verse 2 start; fallback to chorus end
-        try:
-            verse1 = find_verse(song1_path)
-            if verse1 and len(verse1) >= 2:
-                return verse1[1][0]
-        except Exception:
-            pass
+    chorus1 = song1.chorus
+    if not chorus1:
+        return 0.0
+
+    if mode == "loop":
+        # Composite section starts at end of Song 1 Chorus 1
         return chorus1[0][1]
 
-    except Exception:
-        return 0.0
+    if mode == "tight":
+        # Transition window opens at Song 1 Chorus 1 start
+        return chorus1[0][0]
+
+    # Loose — transition anchored to Song 1 Verse 2 start; fallback to chorus end
+    verse1 = song1.verse
+    if len(verse1) >= 2:
+        return verse1[1][0]
+    return chorus1[0][1]
 
 
 # ---------------------------------------------------------------------------
@@ -102,11 +93,12 @@ def dj_mix(song1_path: str, song2_path: str, output_dir: str = "output") -> str:
             raise FileNotFoundError(f"Audio file not found: {p!r}")
 
     # ── Analyse ─────────────────────────────────────────────────────────────
+    # The builders below re-request the same analysis and hit the cache.
     print("Analysing songs…")
-    bpm1 = get_bpm(song1_path)
-    bpm2 = get_bpm(song2_path)
-    key1 = get_key(song1_path)
-    key2 = get_key(song2_path)
+    cache_dir = os.path.join(output_dir, "analysis_cache")
+    song1, song2 = analyse_songs([song1_path, song2_path], cache_dir)
+    bpm1, key1 = song1.bpm, song1.key
+    bpm2, key2 = song2.bpm, song2.key
 
     bpm_diff  = abs(bpm1 - bpm2)
     bpm_loop  = bpm_diff <= 10
@@ -136,7 +128,7 @@ def dj_mix(song1_path: str, song2_path: str, output_dir: str = "output") -> str:
 
     # ── Transition timestamp (for filename) ──────────────────────────────────
     print(f"\nComputing transition timestamp for filename…")
-    trans_sec = _transition_timestamp(mode, song1_path, bpm1)
+    trans_sec = _transition_timestamp(mode, song1)
 
     print(
         f"\n{'─'*52}\n"
@@ -425,7 +425,7 @@ async function loadSong(file, deck) {
 
     const song = {
       name,
-      filename:  file.name,
+      filename:  data.filename || file.name,
       bpm:       data.bpm != null ? `${data.bpm} BPM` : '?',
       bpm_raw:   data.bpm,
       key:       data.key_name || '?',
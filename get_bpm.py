@@ -1,7 +1,11 @@
 """BPM estimation from WAV audio files."""
 
+import functools
 import os
 import essentia.standard as es
+import numpy as np
+
+_ANALYSIS_SR = 44100    # rate MonoLoader decodes to and RhythmExtractor2013 expects
 
 
 def get_bpm(filepath: str) -> float:
@@ -31,7 +35,14 @@ def get_bpm(filepath: str) -> float:
     """
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"Audio file not found: {filepath!r}")
+    st = os.stat(filepath)
+    return _get_bpm_cached(os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+
 
+@functools.lru_cache(maxsize=128)
+def _get_bpm_cached(filepath: str, mtime_ns: int, size: int) -> float:
+    # mtime_ns / size are part of the cache key only, so an edited file misses.
+    # Failures raise and are therefore never cached.
     try:
         audio = es.MonoLoader(filename=filepath)()
     except Exception as exc:
@@ -42,6 +53,40 @@ def get_bpm(filepath: str) -> float:
     if len(audio) == 0:
         raise ValueError(f"Audio file contains no samples: {filepath!r}")
 
+    return _bpm_from_audio(audio)
+
+
+def get_bpm_from_array(y: np.ndarray, sr: int) -> float:
+    """Estimate the global BPM of already-decoded mono audio.
+
+    Same estimate as :func:`get_bpm`, for callers that have decoded the file
+    themselves and want to skip a second decode.
+
+    Args:
+        y:  Mono samples.
+        sr: Sample rate of *y* in Hz.
+
+    Returns:
+        Estimated BPM as a float rounded to 2 decimal places,
+        guaranteed to be in the range [60.0, 200.0].
+
+    Raises:
+        ValueError: If *y* is empty or the estimated BPM falls outside the
+            valid range [60, 200].
+    """
+    if len(y) == 0:
+        raise ValueError("Audio contains no samples.")
+
+    audio = np.ascontiguousarray(y, dtype=np.float32)
+    if sr != _ANALYSIS_SR:
+        # Same resampling MonoLoader applies when decoding a file.
+        audio = es.Resample(inputSampleRate=sr, outputSampleRate=_ANALYSIS_SR)(audio)
+
+    return _bpm_from_audio(audio)
+
+
+def _bpm_from_audio(audio: np.ndarray) -> float:
+    """Run RhythmExtractor2013 on 44.1 kHz mono audio and validate the result."""
     rhythm_extractor = es.RhythmExtractor2013(method="multifeature")
     bpm, _, _, _, _ = rhythm_extractor(audio)
 
@@ -24,31 +24,27 @@ from __future__ import annotations
 
 import math
 import os
-import subprocess
 import sys
 
 import librosa
 import numpy as np
-import soundfile as sf
 from scipy.stats import pearsonr
 
 _here = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, _here)
 sys.path.insert(0, os.path.join(_here, "sections"))
 
-from get_bpm import get_bpm
-from get_chorus import find_chorus
-from get_verse import find_verse
 from many_transitions import (
     BPM_TIGHT_THRESHOLD,
     _ensure_stereo,
     _fmt,
-    _resample_stems,
-    _sec_to_samp,
+    _locate_stems,
+    _save,
+    _secs_to_samps,
     _snap_to_beat,
     _snap_to_phrase,
-    _stretch_stem,
-    get_key,
+    _stretch_resample_stems,
+    analyse_songs,
     keys_compatible,
 )
 
@@ -75,38 +71,7 @@ def _split_stems_4(
     Unlike _split_stems in many_transitions, stems are NOT pre-combined so the
     caller can freely form instrumental = bass + drums + other (no vocals).
     """
-    song_name = os.path.splitext(os.path.basename(filepath))[0]
-    stem_dir  = os.path.join(demucs_out_dir, "htdemucs", song_name)
-    _STEM_FILES = ("bass.wav", "drums.wav", "vocals.wav", "other.wav")
-
-    # Check the requested output dir *and* every sibling slot directory (song1/,
-    # song2/, …) so we never re-run DEMUCS when stems were produced under a
-    # different slot in a previous run.
-    stems_parent = os.path.dirname(demucs_out_dir)
-    candidates   = [demucs_out_dir]
-    if os.path.isdir(stems_parent):
-        candidates += [
-            os.path.join(stems_parent, d)
-            for d in os.listdir(stems_parent)
-            if os.path.isdir(os.path.join(stems_parent, d))
-            and os.path.join(stems_parent, d) != demucs_out_dir
-        ]
-
-    stem_dir = None
-    for cand in candidates:
-        cand_stem_dir = os.path.join(cand, "htdemucs", song_name)
-        if all(os.path.exists(os.path.join(cand_stem_dir, f)) for f in _STEM_FILES):
-            stem_dir = cand_stem_dir
-            print(f"  Stems already exist for '{song_name}' in '{cand}'; skipping DEMUCS.")
-            break
-
-    if stem_dir is None:
-        stem_dir = os.path.join(demucs_out_dir, "htdemucs", song_name)
-        os.makedirs(demucs_out_dir, exist_ok=True)
-        subprocess.run(
-            ["python", "-m", "demucs", "--out", demucs_out_dir, filepath],
-            check=True,
-        )
+    stem_dir = _locate_stems(filepath, demucs_out_dir)
 
     bass,  sr = librosa.load(os.path.join(stem_dir, "bass.wav"),   sr=None, mono=False)
     drums, _  = librosa.load(os.path.join(stem_dir, "drums.wav"),  sr=None, mono=False)
@@ -419,17 +384,12 @@ def build_loop_mix(
     # ------------------------------------------------------------------ #
     # 1. Analyse                                                           #
     # ------------------------------------------------------------------ #
-    print("Analysing Song 1…")
-    bpm1        = get_bpm(song1_path)
-    key1        = get_key(song1_path)
-    chorus1_ts  = find_chorus(song1_path)
-    verse1_ts   = find_verse(song1_path)
+    cache_dir = os.path.join(output_dir, "analysis_cache")
 
-    print("Analysing Song 2…")
-    bpm2        = get_bpm(song2_path)
-    key2        = get_key(song2_path)
-    chorus2_ts  = find_chorus(song2_path)
-    verse2_ts   = find_verse(song2_path)
+    print("Analysing Song 1 and Song 2…")
+    (bpm1, key1, chorus1_ts, verse1_ts), (bpm2, key2, chorus2_ts, verse2_ts) = (
+        analyse_songs([song1_path, song2_path], cache_dir)
+    )
 
     # ------------------------------------------------------------------ #
     # 2. Validate                                                          #
@@ -522,23 +482,16 @@ def build_loop_mix(
         stretch_rate = 1.0
         print(f"Song 2 BPM ({bpm2:.1f}) ≥ Song 1 ({bpm1:.1f}); no stretching.")
 
-    bass2  = _stretch_stem(bass2r,  stretch_rate)
-    drums2 = _stretch_stem(drums2r, stretch_rate)
-    vox2   = _stretch_stem(vox2r,   stretch_rate)
-    other2 = _stretch_stem(other2r, stretch_rate)
-
     if sr2 != sr1:
         print(f"Resampling Song 2 stems {sr2} Hz → {sr1} Hz…")
-        bass2, drums2, vox2, other2 = _resample_stems(
-            [bass2, drums2, vox2, other2], sr2, sr1
-        )
+    bass2, drums2, vox2, other2 = _stretch_resample_stems(
+        [bass2r, drums2r, vox2r, other2r], stretch_rate, sr2, sr1
+    )
+    del bass2r, drums2r, vox2r, other2r
 
     # ------------------------------------------------------------------ #
     # 8. Sample-index conversions                                         #
     # ------------------------------------------------------------------ #
-    bar_samp    = _sec_to_samp(bar_dur,    sr1)
-    phrase_samp = _sec_to_samp(phrase_dur, sr1)
-
     # Snap Song 1 boundaries to nearest detected beat
     _s1_v1  = _snap_to_beat(verse1_ts[0][0],  beat_times1)
     _s1_c1s = _snap_to_beat(chorus1_ts[0][0], beat_times1)
@@ -550,17 +503,23 @@ def build_loop_mix(
     _s2_vach = _snap_to_beat(verse_after_ch[0], beat_times2)
     _s2_v2e  = _snap_to_beat(verse2_ts[1][1],   beat_times2)
 
-    s1_v1_start = _sec_to_samp(_s1_v1,  sr1)
-    s1_c1_start = _sec_to_samp(_s1_c1s, sr1)
-    s1_c1_end   = _sec_to_samp(_s1_c1e, sr1)
-
-    # Song 2 in stretched domain
-    s2_c1_start        = _sec_to_samp(_s2_c1s  / stretch_rate, sr1)
-    s2_c1_end          = _sec_to_samp(_s2_c1e  / stretch_rate, sr1)
-    d2_chorus_samp     = s2_c1_end - s2_c1_start
-
-    s2_verse_ach_start = _sec_to_samp(_s2_vach / stretch_rate, sr1)
-    s2_v2_end          = _sec_to_samp(_s2_v2e  / stretch_rate, sr1)
+    # Song 2 times are divided by stretch_rate to land in the stretched domain.
+    (
+        bar_samp, phrase_samp,
+        s1_v1_start, s1_c1_start, s1_c1_end,
+        s2_c1_start, s2_c1_end, s2_verse_ach_start, s2_v2_end,
+    ) = _secs_to_samps(
+        [
+            bar_dur, phrase_dur,
+            _s1_v1, _s1_c1s, _s1_c1e,
+            _s2_c1s  / stretch_rate,
+            _s2_c1e  / stretch_rate,
+            _s2_vach / stretch_rate,
+            _s2_v2e  / stretch_rate,
+        ],
+        sr1,
+    )
+    d2_chorus_samp = s2_c1_end - s2_c1_start
 
     print(
         f"\nPhrase       : {phrase_dur:.2f}s\n"
@@ -653,9 +612,9 @@ def build_loop_mix(
         pieces.append(s2_tail)
     mix = np.concatenate(pieces, axis=1)
 
-    peak = np.max(np.abs(mix))
-    if peak > 0:
-        mix = mix * (0.9 / peak)
+    # Peak normalise to 0.9 — applied by _save while it writes.
+    peak = max(mix.max(), -mix.min())
+    mix_gain = 0.9 / peak if peak > 0 else 1.0
 
     # ------------------------------------------------------------------ #
     # 17. Save                                                            #
@@ -663,14 +622,9 @@ def build_loop_mix(
     song1_name = os.path.splitext(os.path.basename(song1_path))[0]
     song2_name = os.path.splitext(os.path.basename(song2_path))[0]
 
-    def _save(path: str, audio: np.ndarray, sr: int) -> None:
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        sf.write(path, audio.T, sr)
-        print(f"  Saved: {path}")
-
     mixes_dir = os.path.join(output_dir, "mixes")
     mix_path  = os.path.join(mixes_dir, f"{song1_name}_{song2_name}_loop_mix.wav")
-    _save(mix_path, mix, sr1)
+    _save(mix_path, mix, sr1, gain=mix_gain)
 
     print(
         f"\n{'Tight' if tight else 'Loose'} loop mix complete.\n"
@@ -24,23 +24,30 @@ Key compatibility uses the Camelot wheel — any one of:
 
 from __future__ import annotations
 
+import functools
+import hashlib
+import json
 import math
 import os
-import subprocess
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
 
 import essentia.standard as es
 import librosa
 import numpy as np
 import soundfile as sf
+import soxr
 
 _here = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, _here)
 sys.path.insert(0, os.path.join(_here, "sections"))
 
-from get_bpm import get_bpm
+from _features import analyze
 from get_chorus import find_chorus
 from get_verse import find_verse
+from stemsplitter import save_stems
 
 
 # ---------------------------------------------------------------------------
@@ -50,6 +57,21 @@ from get_verse import find_verse
 BPM_TIGHT_THRESHOLD = 5    # |bpm1 - bpm2| ≤ this → eligible for tight (BPM-only path)
 BPM_LOOSE_THRESHOLD = 15   # |bpm1 - bpm2| ≤ this AND keys compatible → also tight
 
+# Storage dtype for the full-length (stretched) Song 2 stems, halving their
+# memory.  Blends up-cast each phrase-sized slice to float32, but the float16
+# rounding itself is kept: with an 11-bit significand the error near full
+# scale is up to ~2.4e-4, about 8 PCM16 LSBs (3.05e-5) — roughly -72 dBFS,
+# inaudible under the mix but not below the 16-bit noise floor.
+_STEM_DTYPE = np.float16
+
+_WRITE_BLOCK = 1 << 16     # frames per block when streaming WAVs to disk
+
+# STFT geometry for the GPU phase vocoder — matches librosa.effects.time_stretch.
+_STFT_N_FFT = 2048
+_STFT_HOP   = 512
+
+_ANALYSIS_SR = 44100    # rate MonoLoader decodes to and KeyExtractor expects
+
 # Enharmonic normalisation: flatten → sharp equivalent
 _ENHARMONICS: dict[str, str] = {
     "Db": "C#", "Eb": "D#", "Fb": "E", "Gb": "F#",
@@ -108,7 +130,31 @@ def get_key(filepath: str) -> tuple[int, str]:
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"Audio file not found: {filepath!r}")
 
-    audio = es.MonoLoader(filename=filepath)()
+    return _key_from_audio(es.MonoLoader(filename=filepath)())
+
+
+def get_key_from_array(y: np.ndarray, sr: int) -> tuple[int, str]:
+    """Return the Camelot (number, letter) for already-decoded mono audio.
+
+    Same estimate as :func:`get_key`, for callers that have decoded the file
+    themselves and want to skip a second decode.
+
+    Args:
+        y:  Mono samples.
+        sr: Sample rate of *y* in Hz.
+
+    Raises:
+        ValueError: Key returned by Essentia is not in the Camelot table.
+    """
+    audio = np.ascontiguousarray(y, dtype=np.float32)
+    if sr != _ANALYSIS_SR:
+        # Same resampling MonoLoader applies when decoding a file.
+        audio = es.Resample(inputSampleRate=sr, outputSampleRate=_ANALYSIS_SR)(audio)
+    return _key_from_audio(audio)
+
+
+def _key_from_audio(audio: np.ndarray) -> tuple[int, str]:
+    """Run KeyExtractor on 44.1 kHz mono audio and map it to the Camelot wheel."""
     key_name, scale, _ = es.KeyExtractor()(audio)
 
     # Normalise enharmonic equivalents (e.g. "Db" → "C#")
@@ -148,13 +194,100 @@ def keys_compatible(c1: tuple[int, str], c2: tuple[int, str]) -> bool:
     return False
 
 
+# ---------------------------------------------------------------------------
+# Cached song analysis
+# ---------------------------------------------------------------------------
+
+class SongAnalysis(NamedTuple):
+    """BPM, Camelot key and section timestamps for one song."""
+    bpm:    float
+    key:    tuple[int, str]
+    chorus: list[tuple[float, float]]
+    verse:  list[tuple[float, float]]
+
+
+def analyse_song(filepath: str, cache_dir: str | None = None) -> SongAnalysis:
+    """Estimate BPM and key and find chorus and verse sections of filepath, with caching.
+
+    Results are memoised in-process and, when cache_dir is given, persisted as
+    ``<cache_dir>/<digest>.json`` keyed by the file's content hash, so a track
+    is only ever analysed once no matter how many mixes it appears in.
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Audio file not found: {filepath!r}")
+    return _analyse_song_cached(_file_digest(filepath), filepath, cache_dir)
+
+
+def analyse_songs(
+    filepaths: list[str], cache_dir: str | None = None
+) -> list[SongAnalysis]:
+    """Run analyse_song over several files concurrently, preserving order."""
+    with ThreadPoolExecutor(max_workers=max(1, len(filepaths))) as ex:
+        return list(ex.map(lambda p: analyse_song(p, cache_dir), filepaths))
+
+
+@functools.lru_cache(maxsize=32)
+def _analyse_song_cached(
+    digest: str, filepath: str, cache_dir: str | None
+) -> SongAnalysis:
+    cache_path = os.path.join(cache_dir, f"{digest}.json") if cache_dir else None
+
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            data = json.load(f)
+        return SongAnalysis(
+            bpm=data["bpm"],
+            key=tuple(data["key"]),
+            chorus=[tuple(ts) for ts in data["chorus"]],
+            verse=[tuple(ts) for ts in data["verse"]],
+        )
+
+    # One decode, BPM estimate and CQT, memoised, for everything below: the
+    # BPM is taken from it, the key is estimated from its samples, and chorus
+    # and verse detection read its per-bar features.  Key detection runs in
+    # Essentia C code that releases the GIL, so it overlaps the sections pass.
+    feats = analyze(filepath)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        key = ex.submit(get_key_from_array, feats.y, feats.sr)
+        chorus, verse = find_chorus(filepath), find_verse(filepath)
+        analysis = SongAnalysis(
+            bpm=feats.bpm,
+            key=key.result(),
+            chorus=chorus,
+            verse=verse,
+        )
+
+    if cache_path:
+        # A unique temp file per writer: a shared "<digest>.json.tmp" let two
+        # processes analysing the same track truncate each other's output.
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(analysis._asdict(), f)
+        os.replace(f.name, cache_path)
+
+    return analysis
+
+
 # ---------------------------------------------------------------------------
 # Audio helpers
 # ---------------------------------------------------------------------------
 
+# Audio is kept channel-first, (channels, N), throughout: librosa, torchaudio and
+# the STFT all want time on the last axis, and each row is contiguous so the
+# blends run as flat vector loops.  Interleaving to (N, channels) happens only
+# inside _save, one block at a time.
+
 def _ensure_stereo(y: np.ndarray) -> np.ndarray:
-    """Convert mono (N,) to stereo (2, N) by duplication; leave stereo unchanged."""
-    return np.stack([y, y]) if y.ndim == 1 else y
+    """Convert mono (N,) to stereo (2, N) by duplication; leave stereo unchanged.
+
+    The result is always C-contiguous float32, so later ``stem[:, a:b]`` slices
+    and stem arithmetic stay on NumPy's fast contiguous loops instead of the
+    buffered path taken for transposed / mixed-dtype operands.
+    """
+    y = np.stack([y, y]) if y.ndim == 1 else y
+    return np.ascontiguousarray(y, dtype=np.float32)
 
 
 def _snap_to_phrase(start_sec: float, phrase_sec: float) -> float:
@@ -173,19 +306,42 @@ def _snap_to_beat(sec: float, beat_times: np.ndarray) -> float:
     return float(beat_times[idx])
 
 
-def _sec_to_samp(sec: float, sr: int) -> int:
-    return int(round(sec * sr))
+def _secs_to_samps(secs: list[float], sr: int) -> list[int]:
+    """Convert a batch of timestamps to rounded sample indices in one NumPy pass."""
+    return np.rint(np.asarray(secs, dtype=np.float64) * sr).astype(np.int64).tolist()
 
 
-def _split_stems(
-    filepath: str, demucs_out_dir: str
-) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
-    """Run DEMUCS and return unnormalized (low, mid, high, sr) stereo arrays.
+def _sum_stems(stems: tuple[np.ndarray, ...], start: int, end: int) -> np.ndarray:
+    """Return sum(stem[:, start:end]) as float32 without building the full-length mix."""
+    out = stems[0][:, start:end].astype(np.float32)
+    for stem in stems[1:]:
+        out += stem[:, start:end]
+    return out
 
-    Stems are NOT normalised so that low + mid + high ≈ original audio.
-    Each stem has shape (2, N), dtype float32.
+
+def _file_digest(filepath: str, length: int = 32) -> str:
+    """Return the first `length` hex chars of the SHA-256 of a file's contents.
+
+    The file is streamed in 1 MB chunks so large WAVs are never held in memory.
+    The default 16 bytes keeps collisions out of reach: the digest alone keys
+    the analysis cache shared by every song.
+    """
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:length]
+
+
+def _locate_stems(filepath: str, demucs_out_dir: str) -> str:
+    """Return the htdemucs stem directory for filepath, running DEMUCS if needed.
+
+    Stem directories are named ``<song>-<digest>`` after the file contents, so a
+    re-encoded or edited input never picks up stale stems.
     """
     song_name   = os.path.splitext(os.path.basename(filepath))[0]
+    digest      = _file_digest(filepath)
+    stem_name   = f"{song_name}-{digest}"
     _STEM_FILES = ("bass.wav", "drums.wav", "vocals.wav", "other.wav")
 
     # Search demucs_out_dir and any sibling slot directories for existing stems
@@ -202,19 +358,30 @@ def _split_stems(
 
     stem_dir = None
     for cand in candidates:
-        cand_stem_dir = os.path.join(cand, "htdemucs", song_name)
+        cand_stem_dir = os.path.join(cand, "htdemucs", stem_name)
         if all(os.path.exists(os.path.join(cand_stem_dir, f)) for f in _STEM_FILES):
             stem_dir = cand_stem_dir
             print(f"  Stems already exist for '{song_name}' in '{cand}'; skipping DEMUCS.")
             break
 
     if stem_dir is None:
-        stem_dir = os.path.join(demucs_out_dir, "htdemucs", song_name)
-        os.makedirs(demucs_out_dir, exist_ok=True)
-        subprocess.run(
-            ["python", "-m", "demucs", "--out", demucs_out_dir, filepath],
-            check=True,
-        )
+        # In-process, so the htdemucs model stays loaded in this (worker)
+        # process across songs instead of being reloaded per subprocess.
+        stem_dir = os.path.join(demucs_out_dir, "htdemucs", stem_name)
+        save_stems(filepath, stem_dir)
+
+    return stem_dir
+
+
+def _split_stems(
+    filepath: str, demucs_out_dir: str
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """Run DEMUCS and return unnormalized (low, mid, high, sr) stereo arrays.
+
+    Stems are NOT normalised so that low + mid + high ≈ original audio.
+    Each stem has shape (2, N), dtype float32.
+    """
+    stem_dir = _locate_stems(filepath, demucs_out_dir)
 
     bass,  sr = librosa.load(os.path.join(stem_dir, "bass.wav"),   sr=None, mono=False)
     drums, _  = librosa.load(os.path.join(stem_dir, "drums.wav"),  sr=None, mono=False)
@@ -228,27 +395,121 @@ def _split_stems(
     return low, mid, high, int(sr)
 
 
+def _read_stem_window(
+    stem_dir: str, start: int, frames: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Read (low, mid, high) for samples [start, start + frames) from a stem directory.
+
+    Seeks into each WAV instead of decoding it whole, so only the window is
+    ever resident.  Returned arrays have shape (2, n) with n <= frames (short
+    when the stems end before start + frames).
+    """
+    def _read(name: str) -> np.ndarray:
+        with sf.SoundFile(os.path.join(stem_dir, name)) as f:
+            f.seek(min(start, f.frames))
+            return _ensure_stereo(f.read(frames, dtype="float32").T)
+
+    low  = _read("bass.wav")
+    mid  = _read("vocals.wav") + _read("other.wav")
+    high = _read("drums.wav")
+    return low, mid, high
+
+
 def _stretch_stem(stem: np.ndarray, rate: float) -> np.ndarray:
-    """Time-stretch each channel independently; no-op when rate == 1.0."""
+    """Time-stretch all channels of a (2, N) stem in one call; no-op at rate 1.0."""
     if rate == 1.0:
         return stem
-    return np.stack(
-        [librosa.effects.time_stretch(ch, rate=rate) for ch in stem]
-    )
+    return librosa.effects.time_stretch(stem, rate=rate)
 
 
 def _resample_stems(
     stems: list[np.ndarray], sr_from: int, sr_to: int
 ) -> list[np.ndarray]:
-    """Resample a list of stereo stem arrays from sr_from to sr_to."""
+    """Resample a list of stereo stem arrays from sr_from to sr_to.
+
+    soxr filters every channel of a (frames, channels) array in one call.
+    """
     if sr_from == sr_to:
         return stems
     return [
-        np.stack([librosa.resample(ch, orig_sr=sr_from, target_sr=sr_to) for ch in s])
+        np.ascontiguousarray(soxr.resample(s.T, sr_from, sr_to, quality="HQ").T)
         for s in stems
     ]
 
 
+@functools.lru_cache(maxsize=1)
+def _cuda_device():
+    """Return a CUDA torch.device if torch, torchaudio and a GPU are all available."""
+    try:
+        import torch
+        import torchaudio  # noqa: F401
+    except ImportError:
+        return None
+    return torch.device("cuda") if torch.cuda.is_available() else None
+
+
+def _stretch_resample_stems(
+    stems: list[np.ndarray], rate: float, sr_from: int, sr_to: int
+) -> list[np.ndarray]:
+    """Time-stretch a list of equal-length stereo stems by rate, then resample.
+
+    With a CUDA GPU and torchaudio, every channel of every stem goes through a
+    single batched STFT → phase vocoder → iSTFT → resample on the GPU.  Otherwise
+    this falls back to _stretch_stem + _resample_stems (librosa + soxr on the CPU).
+    """
+    device = _cuda_device()
+    if device is None:
+        stems = [_stretch_stem(s, rate) for s in stems]
+        return _resample_stems(stems, sr_from, sr_to)
+    if rate == 1.0 and sr_from == sr_to:
+        return stems
+
+    import torch
+    import torchaudio
+
+    x = torch.from_numpy(np.concatenate(stems, axis=0)).to(device)   # (C, N)
+    if rate != 1.0:
+        window = torch.hann_window(_STFT_N_FFT, device=device)
+        spec   = torch.stft(
+            x, _STFT_N_FFT, hop_length=_STFT_HOP, window=window, return_complex=True
+        )
+        phase_advance = torch.linspace(
+            0, math.pi * _STFT_HOP, spec.shape[-2], device=device
+        )[..., None]
+        spec = torchaudio.functional.phase_vocoder(spec, rate, phase_advance)
+        x    = torch.istft(
+            spec, _STFT_N_FFT, hop_length=_STFT_HOP, window=window,
+            length=int(round(x.shape[-1] / rate)),
+        )
+    if sr_from != sr_to:
+        x = torchaudio.functional.resample(x, sr_from, sr_to)
+
+    out    = x.cpu().numpy()
+    splits = np.cumsum([s.shape[0] for s in stems])[:-1]
+    return [_ensure_stereo(s) for s in np.split(out, splits, axis=0)]
+
+
+def _save(path: str, audio: np.ndarray, sr: int, gain: float = 1.0) -> None:
+    """Write a (channels, N) float array to a 16-bit PCM WAV, block by block.
+
+    Each block is interleaved, scaled by gain, clipped and handed to libsndfile
+    on its own, so peak memory is one block instead of a transposed copy of the
+    whole mix, and normalising costs no extra pass over it.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    n_ch, n = audio.shape
+    buf = np.empty((min(_WRITE_BLOCK, n), n_ch), dtype=np.float32)
+    with sf.SoundFile(
+        path, "w", samplerate=sr, channels=n_ch, subtype="PCM_16"
+    ) as f:
+        for start in range(0, n, _WRITE_BLOCK):
+            block = buf[: min(_WRITE_BLOCK, n - start)]
+            np.multiply(audio[:, start : start + _WRITE_BLOCK].T, gain, out=block)
+            np.clip(block, -1.0, 1.0, out=block)
+            f.write(block)
+    print(f"  Saved: {path}")
+
+
 def _fmt(sec: float) -> str:
     m = int(sec) // 60
     s = sec - m * 60
@@ -271,6 +532,8 @@ def _build_tight_transition(
 ) -> np.ndarray:
     """Chorus→chorus: 1-phrase low-swap then hard cut to Song 2.
 
+    low1/mid1/high1 are Song 1 stem windows that begin at ``trans_start``.
+
     Layout:
         Song 1 continuous [s1_v1_start → trans_start)
         Phase A            [trans_start, trans_start + phrase_samples)
@@ -280,19 +543,18 @@ def _build_tight_transition(
     fade_in  = np.linspace(0.0, 1.0, phrase_samples, dtype=np.float32)
 
     def _sl(stem: np.ndarray, start: int) -> np.ndarray:
-        return stem[:, start : start + phrase_samples]
+        return stem[:, start : start + phrase_samples].astype(np.float32, copy=False)
 
     s1_pre = y1[:, s1_v1_start : trans_start]
 
     phase_a = (
-        _sl(low1,  trans_start) * fade_out
-        + _sl(mid1,  trans_start)               # mids held at full
-        + _sl(high1, trans_start)               # highs held at full
+        _sl(low1,  0) * fade_out
+        + _sl(mid1,  0)                   # mids held at full
+        + _sl(high1, 0)                   # highs held at full
         + _sl(low2,  s2_start)  * fade_in
     )
 
-    s2_full  = low2 + mid2 + high2
-    s2_after = s2_full[:, s2_start + phrase_samples : s2_end_sample]
+    s2_after = _sum_stems((low2, mid2, high2), s2_start + phrase_samples, s2_end_sample)
 
     return np.concatenate([s1_pre, phase_a, s2_after], axis=1)
 
@@ -311,6 +573,8 @@ def _build_tight_fallback(
 
     Used when Song 1 Chorus 1 is shorter than 2 phrases (no room for an
     internal transition). ``trans_start`` should equal ``s1_c1_end``.
+    low1/mid1/high1 are Song 1 stem windows that begin at ``trans_start`` and
+    span at least two phrases.
 
     Phase A (1 phrase) — lows swap:
         Song 1 lows:  fade 1→0
@@ -326,29 +590,33 @@ def _build_tight_fallback(
     fade_in  = np.linspace(0.0, 1.0, phrase_samples, dtype=np.float32)
 
     def _sl(stem: np.ndarray, start: int) -> np.ndarray:
-        return stem[:, start : start + phrase_samples]
+        return stem[:, start : start + phrase_samples].astype(np.float32, copy=False)
+
+    if mid1.shape[1] < 2 * phrase_samples:
+        raise ValueError(
+            f"Song 1 stem window too short for the fallback blend "
+            f"(need {2 * phrase_samples} samples, have {mid1.shape[1]})."
+        )
 
     s1_pre = y1[:, s1_v1_start : trans_start]
 
     # Phase A: lows swap; Song 1 mids held at full; no highs from either side
     phase_a = (
-        _sl(low1, trans_start) * fade_out
-        + _sl(mid1, trans_start)             # S1 mids held
+        _sl(low1, 0) * fade_out
+        + _sl(mid1, 0)             # S1 mids held
         + _sl(low2, s2_start)  * fade_in
     )
 
     # Phase B: mids swap; Song 2 lows at full; no highs from either side
-    phB_s1 = trans_start + phrase_samples
-    phB_s2 = s2_start    + phrase_samples
+    phB_s2 = s2_start + phrase_samples
     phase_b = (
-        _sl(mid1, phB_s1) * fade_out
+        _sl(mid1, phrase_samples) * fade_out
         + _sl(low2, phB_s2)               # S2 lows at full
         + _sl(mid2, phB_s2) * fade_in
     )
 
     # Hard cut: Song 2 full (highs + vocals slam in)
-    s2_full  = low2 + mid2 + high2
-    s2_after = s2_full[:, s2_start + 2 * phrase_samples : s2_end_sample]
+    s2_after = _sum_stems((low2, mid2, high2), s2_start + 2 * phrase_samples, s2_end_sample)
 
     return np.concatenate([s1_pre, phase_a, phase_b, s2_after], axis=1)
 
@@ -365,6 +633,8 @@ def _build_loose_transition(
 ) -> np.ndarray:
     """Chorus→verse→chorus: 2-phrase gradual frequency-band swap.
 
+    low1/mid1/high1 are Song 1 stem windows that begin at ``trans_start``.
+
     Layout:
         Song 1 continuous [s1_v1_start → trans_start)
         Phase A            [trans_start, trans_start + phrase_samples)
@@ -375,31 +645,31 @@ def _build_loose_transition(
     fade_in  = np.linspace(0.0, 1.0, phrase_samples, dtype=np.float32)
 
     def _sl(stem: np.ndarray, start: int) -> np.ndarray:
-        return stem[:, start : start + phrase_samples]
+        return stem[:, start : start + phrase_samples].astype(np.float32, copy=False)
 
     s1_pre = y1[:, s1_v1_start : trans_start]
 
     # Phase A: lows swap; Song 1 mids+highs held at full
     phase_a = (
-        _sl(low1,  trans_start) * fade_out
-        + _sl(mid1,  trans_start)
-        + _sl(high1, trans_start)
+        _sl(low1,  0) * fade_out
+        + _sl(mid1,  0)
+        + _sl(high1, 0)
         + _sl(low2,  s2_start)  * fade_in
     )
 
-    # Phase B: mids+highs swap; Song 2 lows already at full
-    phB_s1 = trans_start + phrase_samples
-    phB_s2 = s2_start    + phrase_samples
-    phase_b = (
-        _sl(mid1,  phB_s1) * fade_out
-        + _sl(high1, phB_s1) * fade_out
-        + _sl(low2,  phB_s2)
-        + _sl(mid2,  phB_s2) * fade_in
-        + _sl(high2, phB_s2) * fade_in
-    )
+    # Phase B: mids+highs swap; Song 2 lows already at full.
+    # Factored as fade_out·(mid1+high1) + fade_in·(mid2+high2) + low2 and
+    # accumulated in place: two multiplies and two phrase buffers instead of
+    # four multiplies and a temporary per term.
+    phB_s2  = s2_start + phrase_samples
+    phase_b = _sl(mid1, phrase_samples) + _sl(high1, phrase_samples)
+    phase_b *= fade_out
+    s2_mid_high  = _sum_stems((mid2, high2), phB_s2, phB_s2 + phrase_samples)
+    s2_mid_high *= fade_in
+    phase_b += s2_mid_high
+    phase_b += _sl(low2, phB_s2)
 
-    s2_full  = low2 + mid2 + high2
-    s2_after = s2_full[:, s2_start + 2 * phrase_samples : s2_end_sample]
+    s2_after = _sum_stems((low2, mid2, high2), s2_start + 2 * phrase_samples, s2_end_sample)
 
     return np.concatenate([s1_pre, phase_a, phase_b, s2_after], axis=1)
 
@@ -412,6 +682,8 @@ def make_transition(
     song1_path: str,
     song2_path: str,
     output_dir: str = "output",
+    progress_cb: Callable[[str, int], None] | None = None,
+    cache_dir: str | None = None,
 ) -> str:
     """Detect BPM + key, select tight or loose transition, build and save mix.
 
@@ -419,6 +691,11 @@ def make_transition(
         song1_path: Path to the outgoing song WAV.
         song2_path: Path to the incoming song WAV.
         output_dir: Root directory for all output files.
+        progress_cb: Optional ``(stage, percent)`` callback, called as each
+            pipeline step starts.
+        cache_dir: Song-analysis cache directory (see :func:`analyse_song`).
+            Defaults to ``<output_dir>/analysis_cache``; pass a shared one to
+            reuse analyses across output directories.
 
     Returns:
         Path to the saved mix WAV.
@@ -431,20 +708,21 @@ def make_transition(
         if not os.path.exists(p):
             raise FileNotFoundError(f"Audio file not found: {p!r}")
 
+    def _progress(stage: str, pct: int) -> None:
+        if progress_cb is not None:
+            progress_cb(stage, pct)
+
     # ------------------------------------------------------------------ #
     # 1. Analyse songs                                                     #
     # ------------------------------------------------------------------ #
-    print("Analysing Song 1…")
-    bpm1       = get_bpm(song1_path)
-    key1       = get_key(song1_path)
-    chorus1_ts = find_chorus(song1_path)
-    verse1_ts  = find_verse(song1_path)
-
-    print("Analysing Song 2…")
-    bpm2       = get_bpm(song2_path)
-    key2       = get_key(song2_path)
-    chorus2_ts = find_chorus(song2_path)
-    verse2_ts  = find_verse(song2_path)   # optional — used for reference save only
+    if cache_dir is None:
+        cache_dir = os.path.join(output_dir, "analysis_cache")
+
+    _progress("analyse", 20)
+    print("Analysing Song 1 and Song 2…")
+    (bpm1, key1, chorus1_ts, verse1_ts), (bpm2, key2, chorus2_ts, verse2_ts) = (
+        analyse_songs([song1_path, song2_path], cache_dir)
+    )
 
     # ------------------------------------------------------------------ #
     # 2. Decide transition type                                            #
@@ -506,7 +784,9 @@ def make_transition(
             # Chorus too short — transition at end of Song 1 Chorus 1
             transition_start_sec = s1_c1[1]
             use_fallback = True
-        phrases_needed = 1
+        # The fallback blends over two phrases (lows, then mids), so it needs
+        # a two-phrase Song 1 window like the loose path.
+        phrases_needed = 2 if use_fallback else 1
     else:
         s1_v2 = verse1_ts[1]
         transition_start_sec = _snap_to_phrase(s1_v2[0], phrase_duration)
@@ -534,11 +814,12 @@ def make_transition(
     # 5. Stem separation                                                   #
     # ------------------------------------------------------------------ #
     stems_root = os.path.join(output_dir, "stems")
+    _progress("stems", 30)
 
+    # Song 1 stems are only read inside the transition window (step 8), so
+    # just make sure they exist on disk here.
     print("Running DEMUCS on Song 1…")
-    low1, mid1, high1, _ = _split_stems(
-        song1_path, os.path.join(stems_root, "song1")
-    )
+    stem_dir1 = _locate_stems(song1_path, os.path.join(stems_root, "song1"))
 
     print("Running DEMUCS on Song 2…")
     low2_raw, mid2_raw, high2_raw, sr2_stems = _split_stems(
@@ -548,6 +829,7 @@ def make_transition(
     # ------------------------------------------------------------------ #
     # 6. BPM matching — speed up only                                      #
     # ------------------------------------------------------------------ #
+    _progress("stretch", 60)
     if bpm2 < bpm1:
         stretch_rate = bpm1 / bpm2
         print(f"Stretching Song 2: {bpm2:.1f} → {bpm1:.1f} BPM  (×{stretch_rate:.4f})")
@@ -555,37 +837,48 @@ def make_transition(
         stretch_rate = 1.0
         print(f"Song 2 BPM ({bpm2:.1f}) ≥ Song 1 ({bpm1:.1f}); no stretching.")
 
-    low2  = _stretch_stem(low2_raw,  stretch_rate)
-    mid2  = _stretch_stem(mid2_raw,  stretch_rate)
-    high2 = _stretch_stem(high2_raw, stretch_rate)
-
     if sr2_stems != sr1:
         print(f"Resampling Song 2 stems {sr2_stems} Hz → {sr1} Hz…")
-        low2, mid2, high2 = _resample_stems([low2, mid2, high2], sr2_stems, sr1)
+    low2, mid2, high2 = _stretch_resample_stems(
+        [low2_raw, mid2_raw, high2_raw], stretch_rate, sr2_stems, sr1
+    )
+    del low2_raw, mid2_raw, high2_raw
+
+    low2, mid2, high2 = (s.astype(_STEM_DTYPE) for s in (low2, mid2, high2))
 
     # ------------------------------------------------------------------ #
     # 7. Convert timestamps → sample indices                              #
     # ------------------------------------------------------------------ #
-    phrase_samples = _sec_to_samp(phrase_duration, sr1)
-    trans_start    = _sec_to_samp(transition_start_sec, sr1)
-    s1_v1_start    = _sec_to_samp(s1_v1[0], sr1)
-    s1_v1_end      = _sec_to_samp(s1_v1[1], sr1)
-    s1_c1_start    = _sec_to_samp(s1_c1[0], sr1)
-    s1_c1_end      = _sec_to_samp(s1_c1[1], sr1)
-
-    s2_start  = _sec_to_samp(s2_c1[0] / stretch_rate, sr1)
-    s2_v2_end = _sec_to_samp(verse2_ts[1][1] / stretch_rate, sr1)
+    # Song 2 times are divided by stretch_rate to land in the stretched domain.
+    (
+        phrase_samples, trans_start,
+        s1_v1_start, s1_v1_end, s1_c1_start, s1_c1_end,
+        s2_start, s2_c1_end, s2_v1_start, s2_v1_end, s2_v2_end,
+    ) = _secs_to_samps(
+        [
+            phrase_duration, transition_start_sec,
+            s1_v1[0], s1_v1[1], s1_c1[0], s1_c1[1],
+            s2_c1[0] / stretch_rate,
+            s2_c1[1] / stretch_rate,
+            verse2_ts[0][0] / stretch_rate,
+            verse2_ts[0][1] / stretch_rate,
+            verse2_ts[1][1] / stretch_rate,
+        ],
+        sr1,
+    )
 
     # ------------------------------------------------------------------ #
     # 8. Guard: check stems are long enough                               #
     # ------------------------------------------------------------------ #
-    req_s1 = trans_start + phrases_needed * phrase_samples
-    req_s2 = s2_start    + phrases_needed * phrase_samples
+    req_s1 = phrases_needed * phrase_samples
+    req_s2 = s2_start + phrases_needed * phrase_samples
+
+    low1, mid1, high1 = _read_stem_window(stem_dir1, trans_start, req_s1)
 
     if low1.shape[1] < req_s1:
         raise ValueError(
             f"Song 1 stems too short for the transition window "
-            f"(need {req_s1} samples, have {low1.shape[1]})."
+            f"(need {trans_start + req_s1} samples, have {trans_start + low1.shape[1]})."
         )
     if low2.shape[1] < req_s2:
         raise ValueError(
@@ -596,6 +889,7 @@ def make_transition(
     # ------------------------------------------------------------------ #
     # 9. Build mix                                                         #
     # ------------------------------------------------------------------ #
+    _progress("build", 80)
     builder_kwargs = dict(
         y1=y1,
         low1=low1, mid1=mid1, high1=high1,
@@ -614,26 +908,22 @@ def make_transition(
     else:
         mix = _build_loose_transition(**builder_kwargs)
 
-    # Peak normalise to 0.9
-    peak = np.max(np.abs(mix))
-    if peak > 0:
-        mix = mix * (0.9 / peak)
+    # Peak normalise to 0.9 — applied by _save while it writes.  max/-min
+    # find the peak without an abs() copy of the mix.
+    peak = max(mix.max(), -mix.min())
+    mix_gain = 0.9 / peak if peak > 0 else 1.0
 
     # ------------------------------------------------------------------ #
     # 10. Save outputs                                                     #
     # ------------------------------------------------------------------ #
+    _progress("save", 90)
     song1_name = os.path.splitext(os.path.basename(song1_path))[0]
     song2_name = os.path.splitext(os.path.basename(song2_path))[0]
 
-    def _save(path: str, audio: np.ndarray, sr: int) -> None:
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        sf.write(path, audio.T, sr)
-        print(f"  Saved: {path}")
-
     # Final mix
     mixes_dir = os.path.join(output_dir, "mixes")
     mix_path  = os.path.join(mixes_dir, f"{song1_name}_{song2_name}_mix.wav")
-    _save(mix_path, mix, sr1)
+    _save(mix_path, mix, sr1, gain=mix_gain)
 
     # Song 1 reference sections
     out1 = os.path.join(output_dir, "song_1")
@@ -643,21 +933,15 @@ def make_transition(
         _save(os.path.join(out1, "verse2.wav"), y1[:, trans_start:], sr1)
 
     # Song 2 reference sections (stretched)
-    s2_full = low2 + mid2 + high2
-    out2    = os.path.join(output_dir, "song_2")
-    s2_c1_end = _sec_to_samp(s2_c1[1] / stretch_rate, sr1)
+    s2_stems = (low2, mid2, high2)
+    out2     = os.path.join(output_dir, "song_2")
     _save(
         os.path.join(out2, "chorus1.wav"),
-        s2_full[:, s2_start : s2_c1_end],
+        _sum_stems(s2_stems, s2_start, s2_c1_end),
         sr1,
     )
-    if verse2_ts:
-        s2_v1_start = _sec_to_samp(verse2_ts[0][0] / stretch_rate, sr1)
-        s2_v1_end   = min(
-            _sec_to_samp(verse2_ts[0][1] / stretch_rate, sr1),
-            s2_full.shape[1],
-        )
-        _save(os.path.join(out2, "verse1.wav"), s2_full[:, s2_v1_start : s2_v1_end], sr1)
+    s2_v1_end = min(s2_v1_end, low2.shape[1])
+    _save(os.path.join(out2, "verse1.wav"), _sum_stems(s2_stems, s2_v1_start, s2_v1_end), sr1)
 
     print(
         f"\n{'Tight' if tight else 'Loose'} transition complete.\n"
@@ -0,0 +1,143 @@
+"""Shared per-bar audio features for chorus / verse detection.
+
+find_chorus and find_verse both need the decoded audio, the BPM-derived bar
+grid and per-bar chroma + RMS.  analyze() computes these once per file and
+memoises them, so asking for BPM, chorus and verse on the same upload decodes
+the audio and runs the CQT only once.
+"""
+
+from __future__ import annotations
+
+import functools
+import os
+import sys
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+# Allow importing get_bpm from the project root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from get_bpm import get_bpm_from_array
+from _kernels import per_bar_rms
+
+_HOP_LENGTH = 512   # chroma frame hop (samples)
+
+# One lock per file version, so concurrent callers for the same file wait for
+# the first computation instead of each decoding and running the CQT.
+_locks: dict[tuple[str, int, int], threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+class BarFeatures(NamedTuple):
+    """Decoded mono audio plus per-bar features for one file.
+
+    Arrays are shared between callers through the cache and are read-only.
+    """
+    y:            np.ndarray   # mono samples, float32
+    sr:           int
+    bpm:          float
+    bar_duration: float        # seconds per bar (assumes 4/4)
+    bar_samples:  int
+    n_bars:       int
+    chroma_vecs:  np.ndarray   # (n_bars, 12) mean chroma per bar
+    X:            np.ndarray   # (n_bars, 12) L2-normalised chroma_vecs
+    rms_vals:     np.ndarray   # (n_bars,) RMS energy per bar
+
+
+def analyze(filepath: str) -> BarFeatures:
+    """Return the per-bar features of a WAV file, memoised per file version.
+
+    Args:
+        filepath: Absolute or relative path to a ``.wav`` audio file.
+
+    Raises:
+        FileNotFoundError: If no file exists at *filepath*.
+        ValueError: If the audio cannot be decoded or is too short to analyse.
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Audio file not found: {filepath!r}")
+    st = os.stat(filepath)
+    key = (os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        return _analyze_cached(*key)
+
+
+@functools.lru_cache(maxsize=4)
+def _analyze_cached(filepath: str, mtime_ns: int, size: int) -> BarFeatures:
+    # mtime_ns / size are part of the cache key only, so an edited file misses.
+
+    # ------------------------------------------------------------------ #
+    # 1. Load audio and derive bar length from BPM                        #
+    # ------------------------------------------------------------------ #
+    # soundfile directly: native rate, float32, no librosa/audioread detour.
+    try:
+        data, sr = sf.read(filepath, dtype="float32")
+    except Exception as exc:
+        raise ValueError(f"Failed to decode audio file {filepath!r}: {exc}") from exc
+    y = data if data.ndim == 1 else data.mean(axis=1, dtype=np.float32)
+
+    if y.size == 0:
+        raise ValueError(f"Audio file contains no samples: {filepath!r}")
+
+    bpm = get_bpm_from_array(y, sr)      # reuse this decode, don't load again
+    bar_duration = 4.0 * (60.0 / bpm)       # seconds per bar (assumes 4/4)
+    bar_samples = int(bar_duration * sr)
+
+    n_bars = len(y) // bar_samples
+    if n_bars < 4:
+        raise ValueError(
+            f"Audio is too short to analyse ({n_bars} full bars detected). "
+            "At least 4 bars are required."
+        )
+
+    # ------------------------------------------------------------------ #
+    # 2. Chroma + RMS per bar                                             #
+    # ------------------------------------------------------------------ #
+    # One CQT over the whole song, then average its frames within each bar —
+    # far cheaper than a CQT per bar.  chroma_cqt is more pitch-stable than
+    # chroma_stft for short windows.
+    chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=_HOP_LENGTH)  # (12, T)
+    bounds = (np.arange(n_bars + 1) * bar_samples) // _HOP_LENGTH
+    chroma_sums = np.add.reduceat(chroma[:, : bounds[-1]], bounds[:-1], axis=1)
+    chroma_vecs = (chroma_sums / np.diff(bounds)).T.astype(np.float32)       # (N, 12)
+
+    rms_vals = per_bar_rms(y, bar_samples, n_bars)
+
+    # L2-normalise by multiplying with one reciprocal norm per bar: einsum
+    # fuses square + sum, and a multiply replaces the broadcast divide.
+    sq_norms = np.einsum("ij,ij->i", chroma_vecs, chroma_vecs)
+    inv_norms = 1.0 / np.sqrt(sq_norms + 1e-16)
+    X = chroma_vecs * inv_norms[:, None]    # L2-normalised, shape (N, 12)
+
+    for arr in (y, chroma_vecs, X, rms_vals):
+        arr.flags.writeable = False
+
+    return BarFeatures(
+        y=y,
+        sr=int(sr),
+        bpm=bpm,
+        bar_duration=bar_duration,
+        bar_samples=bar_samples,
+        n_bars=n_bars,
+        chroma_vecs=chroma_vecs,
+        X=X,
+        rms_vals=rms_vals,
+    )
+
+
+def segments_from_mask(mask: np.ndarray, min_len: int) -> list[tuple[int, int]]:
+    """Return inclusive ``(start, end)`` index pairs of True runs ≥ min_len long.
+
+    Run boundaries come from one ``np.diff`` over the padded mask, so there is
+    no per-bar Python loop.
+    """
+    edges = np.diff(mask.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)      # exclusive
+    keep = ends - starts >= min_len
+    return list(zip(starts[keep].tolist(), (ends[keep] - 1).tolist()))
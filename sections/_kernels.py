@@ -0,0 +1,48 @@
+"""Optional Numba kernels for the per-bar feature pass.
+
+Numba is not a hard dependency.  Without it, per_bar_rms falls back to a
+NumPy einsum that gives the same values.
+"""
+
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def per_bar_rms(y: np.ndarray, bar_samples: int, n_bars: int) -> np.ndarray:
+    """Return the RMS of each of the first *n_bars* bars of *y* as float32.
+
+    Args:
+        y:           Mono float32 samples, at least ``n_bars * bar_samples`` long.
+        bar_samples: Samples per bar.
+        n_bars:      Number of whole bars to measure.
+    """
+    if HAS_NUMBA:
+        return _per_bar_rms_numba(y, bar_samples, n_bars)
+    bars = y[: n_bars * bar_samples].reshape(n_bars, bar_samples)
+    return np.sqrt(np.einsum("ij,ij->i", bars, bars) / bar_samples).astype(np.float32)
+
+
+if HAS_NUMBA:
+    # Single-threaded: the pass is memory-bound and runs beside the other
+    # analysers' threads, so a parallel region would only oversubscribe cores.
+    @njit(cache=True, fastmath=True)
+    def _per_bar_rms_numba(y, bar_samples, n_bars):
+        # One bar per iteration; each sums its squares in float64.
+        out = np.empty(n_bars, np.float32)
+        for i in range(n_bars):
+            base = i * bar_samples
+            s = 0.0
+            for j in range(bar_samples):
+                v = y[base + j]
+                s += v * v
+            out[i] = math.sqrt(s / bar_samples)
+        return out
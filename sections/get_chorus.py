@@ -6,12 +6,13 @@ import os
 import sys
 
 import numpy as np
-import librosa
 import soundfile as sf
 
 # Allow running as a script from any working directory.
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from get_bpm import get_bpm
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _features import BarFeatures, analyze, segments_from_mask
+
+_SIM_TILE = 64      # rows of the self-similarity matrix computed at a time
 
 
 def find_chorus(filepath: str) -> list[tuple[float, float]]:
@@ -20,7 +21,8 @@ def find_chorus(filepath: str) -> list[tuple[float, float]]:
     Algorithm:
         1. Split the song into fixed-length bars using the estimated BPM.
         2. Compute a mean chroma (CQT) vector per bar as a harmonic fingerprint.
-        3. Build an N×N cosine self-similarity matrix over all bars.
+        3. Build an N×N cosine self-similarity matrix over all bars
+           (in row tiles, never materialised whole).
         4. Score each bar by combining how many other bars it resembles
            (repeat_count) with its RMS energy.  High score → likely chorus.
         5. Use the top-scoring bar as a chorus template and find every other
@@ -39,58 +41,49 @@ def find_chorus(filepath: str) -> list[tuple[float, float]]:
         FileNotFoundError: If no file exists at *filepath*.
         ValueError: If the audio cannot be decoded or is too short to analyse.
     """
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Audio file not found: {filepath!r}")
-
-    # ------------------------------------------------------------------ #
-    # 1. Load audio and derive bar length from BPM                        #
-    # ------------------------------------------------------------------ #
-    try:
-        y, sr = librosa.load(filepath, mono=True, sr=None)
-    except Exception as exc:
-        raise ValueError(f"Failed to decode audio file {filepath!r}: {exc}") from exc
-
-    if y.size == 0:
-        raise ValueError(f"Audio file contains no samples: {filepath!r}")
+    feats = analyze(filepath)
+    segments = _chorus_segments(feats)
+    timestamps = [
+        (s * feats.bar_duration, (e + 1) * feats.bar_duration)
+        for s, e in segments
+    ]
 
-    bpm = get_bpm(filepath)
-    bar_duration = 4.0 * (60.0 / bpm)       # seconds per bar (assumes 4/4)
-    bar_samples = int(bar_duration * sr)
+    # Save first chorus instance as a wav snippet.
+    if segments:
+        s0, e0 = segments[0]
+        chorus_audio = feats.y[s0 * feats.bar_samples : (e0 + 1) * feats.bar_samples]
+        snippet_path = os.path.join(os.path.dirname(os.path.abspath(filepath)),
+                                    "chorus_snippet.wav")
+        sf.write(snippet_path, chorus_audio, feats.sr)
 
-    n_bars = len(y) // bar_samples
-    if n_bars < 4:
-        raise ValueError(
-            f"Audio is too short to analyse ({n_bars} full bars detected). "
-            "At least 4 bars are required."
-        )
+    return timestamps
 
-    # ------------------------------------------------------------------ #
-    # 2. Chroma + RMS per bar                                             #
-    # ------------------------------------------------------------------ #
-    chroma_vecs = np.zeros((n_bars, 12), dtype=np.float32)
-    rms_vals = np.zeros(n_bars, dtype=np.float32)
 
-    for i in range(n_bars):
-        bar = y[i * bar_samples : (i + 1) * bar_samples]
-        # chroma_cqt is more pitch-stable than chroma_stft for short windows.
-        chroma = librosa.feature.chroma_cqt(y=bar, sr=sr)  # (12, T)
-        chroma_vecs[i] = chroma.mean(axis=1)
-        rms_vals[i] = np.sqrt(np.mean(bar ** 2))
+def _chorus_segments(feats: BarFeatures) -> list[tuple[int, int]]:
+    """Return chorus segments as inclusive ``(start_bar, end_bar)`` pairs."""
+    X = feats.X
+    rms_vals = feats.rms_vals
 
     # ------------------------------------------------------------------ #
-    # 3. Cosine self-similarity matrix (pure numpy)                       #
-    # ------------------------------------------------------------------ #
-    norms = np.linalg.norm(chroma_vecs, axis=1, keepdims=True)
-    X = chroma_vecs / (norms + 1e-8)        # L2-normalised, shape (N, 12)
-    sim_matrix = X @ X.T                    # (N, N) cosine similarities
-
-    # ------------------------------------------------------------------ #
-    # 4. Score bars: repeat count weighted with energy                    #
+    # 3–4. Cosine self-similarity, scored as repeat count + energy        #
     # ------------------------------------------------------------------ #
+    # The N×N similarity matrix is built one row block at a time and reduced
+    # straight to per-bar repeat counts, so only a cache-sized tile is ever
+    # resident.  It is symmetric, so each block only covers columns from its
+    # own diagonal onward (SYRK-style, half the FLOPs): row sums count the
+    # block's bars, column sums beyond the block count the later bars.
+    # Kept in float32: NumPy's integer matmul bypasses BLAS, and
+    # int8-quantised chroma flips bars near the threshold.
     threshold = 0.85
-    sim_binary = sim_matrix > threshold
-    np.fill_diagonal(sim_binary, False)     # don't count self-match
-    repeat_count = sim_binary.sum(axis=1).astype(np.float32)
+    n_bars = len(X)
+    repeat_count = np.zeros(n_bars, dtype=np.float32)
+    for i in range(0, n_bars, _SIM_TILE):
+        above = (X[i : i + _SIM_TILE] @ X[i:].T) > threshold   # (B, N - i)
+        b = above.shape[0]
+        rows = np.arange(b)
+        above[rows, rows] = False                               # don't count self-match
+        repeat_count[i : i + b] += above.sum(axis=1, dtype=np.float32)
+        repeat_count[i + b :] += above[:, b:].sum(axis=0, dtype=np.float32)
 
     # Graceful normalisation — avoid divide-by-zero on silent tracks.
     repeat_score = repeat_count / (repeat_count.max() + 1e-8)
@@ -103,6 +96,9 @@ def find_chorus(filepath: str) -> list[tuple[float, float]]:
     # ------------------------------------------------------------------ #
     # 5. Identify all bars matching the chorus template                   #
     # ------------------------------------------------------------------ #
+    # The template is only known once every tile has been reduced, and the
+    # tiles are not kept, so there is no stored row to index here.  One
+    # (N, 12) mat-vec is far cheaper than holding the N×N matrix for it.
     sims_to_template = X @ X[template_idx]  # (N,) cosine sim vs template
 
     # Chroma alone is too permissive — a song in a consistent key will have
@@ -114,40 +110,7 @@ def find_chorus(filepath: str) -> list[tuple[float, float]]:
     # 6. Group consecutive chorus bars into segments                      #
     # ------------------------------------------------------------------ #
     min_chorus_bars = 4     # ~8 s at 120 BPM; filters isolated stray bars
-
-    segments: list[tuple[int, int]] = []
-    in_seg = False
-    seg_start = 0
-    for i, is_chorus in enumerate(chorus_mask):
-        if is_chorus and not in_seg:
-            seg_start = i
-            in_seg = True
-        elif not is_chorus and in_seg:
-            if i - seg_start >= min_chorus_bars:
-                segments.append((seg_start, i - 1))
-            in_seg = False
-    if in_seg and n_bars - seg_start >= min_chorus_bars:
-        segments.append((seg_start, n_bars - 1))
-
-    # ------------------------------------------------------------------ #
-    # 7. Convert bar indices → seconds                                    #
-    # ------------------------------------------------------------------ #
-    timestamps = [
-        (s * bar_duration, (e + 1) * bar_duration)
-        for s, e in segments
-    ]
-
-    # ------------------------------------------------------------------ #
-    # 8. Save first chorus instance as a wav snippet                      #
-    # ------------------------------------------------------------------ #
-    if segments:
-        s0, e0 = segments[0]
-        chorus_audio = y[s0 * bar_samples : (e0 + 1) * bar_samples]
-        snippet_path = os.path.join(os.path.dirname(os.path.abspath(filepath)),
-                                    "chorus_snippet.wav")
-        sf.write(snippet_path, chorus_audio, sr)
-
-    return timestamps
+    return segments_from_mask(chorus_mask, min_chorus_bars)
 
 
 # ---------------------------------------------------------------------- #
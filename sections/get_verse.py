@@ -6,17 +6,12 @@ import os
 import sys
 
 import numpy as np
-import librosa
 import soundfile as sf
 
-# Allow importing get_bpm from the project root and get_chorus from sections/.
-_here = os.path.dirname(os.path.abspath(__file__))
-_root = os.path.dirname(_here)
-sys.path.insert(0, _root)   # for get_bpm
-sys.path.insert(0, _here)   # for get_chorus (same directory)
-
-from get_bpm import get_bpm
-from get_chorus import find_chorus
+# Allow importing the shared feature cache and get_chorus from sections/.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _features import analyze, segments_from_mask
+from get_chorus import _chorus_segments
 
 
 def find_verse(filepath: str) -> list[tuple[float, float]]:
@@ -25,7 +20,8 @@ def find_verse(filepath: str) -> list[tuple[float, float]]:
     Algorithm:
         1. Split the song into fixed-length bars using the estimated BPM.
         2. Compute a mean chroma (CQT) vector and RMS per bar.
-        3. Call find_chorus() to locate chorus bars and measure chorus energy.
+        3. Run chorus detection on the same features to locate chorus bars
+           and measure chorus energy.
         4. For each chorus start, look at the 8 bars immediately before it —
            these pre-chorus windows anchor the verse template.
         5. Average those pre-chorus chroma vectors into a single verse template.
@@ -48,63 +44,31 @@ def find_verse(filepath: str) -> list[tuple[float, float]]:
         FileNotFoundError: If no file exists at *filepath*.
         ValueError: If the audio cannot be decoded or is too short to analyse.
     """
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Audio file not found: {filepath!r}")
-
-    # ------------------------------------------------------------------ #
-    # 1. Load audio and derive bar length from BPM                        #
-    # ------------------------------------------------------------------ #
-    try:
-        y, sr = librosa.load(filepath, mono=True, sr=None)
-    except Exception as exc:
-        raise ValueError(f"Failed to decode audio file {filepath!r}: {exc}") from exc
-
-    if y.size == 0:
-        raise ValueError(f"Audio file contains no samples: {filepath!r}")
-
-    bpm = get_bpm(filepath)
-    bar_duration = 4.0 * (60.0 / bpm)       # seconds per bar (assumes 4/4)
-    bar_samples = int(bar_duration * sr)
-
-    n_bars = len(y) // bar_samples
-    if n_bars < 4:
-        raise ValueError(
-            f"Audio is too short to analyse ({n_bars} full bars detected). "
-            "At least 4 bars are required."
-        )
-
-    # ------------------------------------------------------------------ #
-    # 2. Chroma + RMS per bar                                             #
-    # ------------------------------------------------------------------ #
-    chroma_vecs = np.zeros((n_bars, 12), dtype=np.float32)
-    rms_vals = np.zeros(n_bars, dtype=np.float32)
-
-    for i in range(n_bars):
-        bar = y[i * bar_samples : (i + 1) * bar_samples]
-        chroma = librosa.feature.chroma_cqt(y=bar, sr=sr)  # (12, T)
-        chroma_vecs[i] = chroma.mean(axis=1)
-        rms_vals[i] = np.sqrt(np.mean(bar ** 2))
-
-    norms = np.linalg.norm(chroma_vecs, axis=1, keepdims=True)
-    X = chroma_vecs / (norms + 1e-8)        # L2-normalised, shape (N, 12)
+    feats = analyze(filepath)
+    y = feats.y
+    sr = feats.sr
+    bar_duration = feats.bar_duration
+    bar_samples = feats.bar_samples
+    n_bars = feats.n_bars
+    X = feats.X
+    rms_vals = feats.rms_vals
 
     # ------------------------------------------------------------------ #
     # 3. Find chorus → anchor points and energy ceiling                   #
     # ------------------------------------------------------------------ #
-    chorus_timestamps = find_chorus(filepath)
+    # Take the chorus as inclusive bar segments straight from the cached
+    # features — no find_chorus() re-run and no seconds → bars round trip.
+    chorus_segments = _chorus_segments(feats)
 
-    if not chorus_timestamps:
+    if not chorus_segments:
         # Without a chorus reference we can't locate the verse reliably.
         return []
 
-    # Convert chorus timestamps to bar indices.
-    chorus_bar_starts = [int(ts[0] / bar_duration) for ts in chorus_timestamps]
-    chorus_bar_ends   = [min(n_bars - 1, int(ts[1] / bar_duration))
-                         for ts in chorus_timestamps]
+    chorus_bar_starts = [s for s, _ in chorus_segments]
 
     # Build a boolean mask of all chorus bars so we can exclude them later.
     chorus_bar_mask = np.zeros(n_bars, dtype=bool)
-    for s, e in zip(chorus_bar_starts, chorus_bar_ends):
+    for s, e in chorus_segments:
         chorus_bar_mask[s : e + 1] = True
 
     # Median RMS of all chorus bars → energy ceiling for verse candidates.
@@ -117,17 +81,15 @@ def find_verse(filepath: str) -> list[tuple[float, float]]:
     # (or pre-chorus).  Averaging these windows across all chorus instances
     # gives a robust harmonic fingerprint of the verse.
     lookback = 8        # bars to look back before each chorus start
-    pre_chorus_vecs: list[np.ndarray] = []
+    pre_chorus_mask = np.zeros(n_bars, dtype=bool)
 
     for c_start in chorus_bar_starts:
-        window_start = max(0, c_start - lookback)
-        if c_start > window_start:
-            pre_chorus_vecs.extend(X[window_start:c_start])
+        pre_chorus_mask[max(0, c_start - lookback) : c_start] = True
 
-    if not pre_chorus_vecs:
+    if not pre_chorus_mask.any():
         return []
 
-    verse_template = np.mean(pre_chorus_vecs, axis=0).astype(np.float32)
+    verse_template = X[pre_chorus_mask].mean(axis=0, dtype=np.float32)
     verse_template /= (np.linalg.norm(verse_template) + 1e-8)
 
     # ------------------------------------------------------------------ #
@@ -146,20 +108,7 @@ def find_verse(filepath: str) -> list[tuple[float, float]]:
     # 6. Group consecutive verse bars into segments                       #
     # ------------------------------------------------------------------ #
     min_verse_bars = 4      # ~8 s at 120 BPM; drops isolated stray bars
-
-    segments: list[tuple[int, int]] = []
-    in_seg = False
-    seg_start = 0
-    for i, is_verse in enumerate(verse_mask):
-        if is_verse and not in_seg:
-            seg_start = i
-            in_seg = True
-        elif not is_verse and in_seg:
-            if i - seg_start >= min_verse_bars:
-                segments.append((seg_start, i - 1))
-            in_seg = False
-    if in_seg and n_bars - seg_start >= min_verse_bars:
-        segments.append((seg_start, n_bars - 1))
+    segments = segments_from_mask(verse_mask, min_verse_bars)
 
     # A verse must repeat — drop the whole result if only one instance found.
     if len(segments) < 2:
@@ -1,49 +1,95 @@
-import subprocess
+import functools
 import os
-import librosa
 import numpy as np
-from scipy.io.wavfile import write as wav_write
+import soundfile as sf
 
-def demucs_hml(filepath, output_dir='separated'):
-    # run demucs
-    subprocess.run([
-        'python', '-m', 'demucs',
-        '--out', output_dir,
-        filepath
-    ])
 
+@functools.lru_cache(maxsize=1)
+def _load_model():
+    # torch/demucs import and the htdemucs weights take several seconds, so
+    # load them once per process, on first use, instead of per subprocess
+    import torch
+    from demucs.pretrained import get_model
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = get_model('htdemucs')
+    model.to(device)
+    model.eval()
+    return model, device
+
+
+def _separate(filepath):
+    # same preprocessing as `python -m demucs`: convert to the model's rate and
+    # channel count, standardise, separate, then undo the standardisation
+    import torch
+    from demucs.apply import apply_model
+    from demucs.audio import convert_audio
+
+    model, device = _load_model()
+
+    data, sr = sf.read(filepath, dtype='float32', always_2d=True)
+    wav = convert_audio(torch.from_numpy(data.T.copy()), sr,
+                        model.samplerate, model.audio_channels)
+
+    ref = wav.mean(0)
+    wav = (wav - ref.mean()) / ref.std()
+    with torch.no_grad():
+        sources = apply_model(model, wav[None], device=device,
+                              shifts=1, split=True, overlap=0.25)[0]
+    sources = sources * ref.std() + ref.mean()
+
+    stems = {name: src.cpu().numpy() for name, src in zip(model.sources, sources)}
+    return stems, model.samplerate
+
+
+def save_stems(filepath, stem_dir):
+    # separate in-process and write the raw stems to stem_dir, as the demucs
+    # CLI would; returns the unscaled stems for callers that keep working on them
+    stems, sr = _separate(filepath)
+    os.makedirs(stem_dir, exist_ok=True)
+    for name, stem in stems.items():
+        # stems can overshoot full scale and PCM_16 would wrap them around, so
+        # rescale like the CLI's default clip mode before writing
+        peak = np.abs(stem).max()
+        sf.write(os.path.join(stem_dir, f'{name}.wav'),
+                 stem.T / max(1.0, peak / 0.99), sr, subtype='PCM_16')
+    return stems, sr
+
+
+def demucs_hml(filepath, output_dir='separated'):
+    # run demucs in-process, keeping the raw stems where the demucs CLI used to put them
     song_name = os.path.splitext(os.path.basename(filepath))[0]
-    stem_dir  = os.path.join(output_dir, 'htdemucs', song_name)
+    stems, sr = save_stems(filepath, os.path.join(output_dir, 'htdemucs', song_name))
+    bass, drums = stems['bass'], stems['drums']
+    vox, other  = stems['vocals'], stems['other']
+
+    # mid must be summed from the raw stems, before they are rescaled below
+    mid = vox + other
 
-    # load stems
-    bass,  sr = librosa.load(os.path.join(stem_dir, 'bass.wav'),  sr=None, mono=False)
-    drums, _  = librosa.load(os.path.join(stem_dir, 'drums.wav'), sr=None, mono=False)
-    vox,   _  = librosa.load(os.path.join(stem_dir, 'vocals.wav'),sr=None, mono=False)
-    other, _  = librosa.load(os.path.join(stem_dir, 'other.wav'), sr=None, mono=False)
+    # peak-normalize in place (no second full-size copy per stem);
+    # low/high are just the normalized bass/drums
+    for stem in (bass, drums, vox, other, mid):
+        stem /= np.abs(stem).max() + 1e-12
 
     # combine into high/mid/low
     low  = bass
-    mid  = vox + other
     high = drums
 
-    # normalize
-    low  = low  / np.max(np.abs(low))
-    mid  = mid  / np.max(np.abs(mid))
-    high = high / np.max(np.abs(high))
+    # 16-bit PCM is all downstream needs and half the size of float32 WAVs
+    sf.write('low.wav',  low.T,  sr, subtype='PCM_16')
+    sf.write('mid.wav',  mid.T,  sr, subtype='PCM_16')
+    sf.write('high.wav', high.T, sr, subtype='PCM_16')
 
-    wav_write('low.wav',  sr, low.T.astype(np.float32))
-    wav_write('mid.wav',  sr, mid.T.astype(np.float32))
-    wav_write('high.wav', sr, high.T.astype(np.float32))
-    
     # save individual stems too
-    vox_norm = vox / np.max(np.abs(vox))
-    wav_write('vocals.wav', sr, vox_norm.T.astype(np.float32))
-    wav_write('drums.wav',  sr, (drums / np.max(np.abs(drums))).T.astype(np.float32))
-    wav_write('bass.wav',   sr, (bass  / np.max(np.abs(bass))).T.astype(np.float32))
-    wav_write('other.wav',  sr, (other / np.max(np.abs(other))).T.astype(np.float32))
+    sf.write('vocals.wav', vox.T,   sr, subtype='PCM_16')
+    sf.write('drums.wav',  drums.T, sr, subtype='PCM_16')
+    sf.write('bass.wav',   bass.T,  sr, subtype='PCM_16')
+    sf.write('other.wav',  other.T, sr, subtype='PCM_16')
 
     print("Saved low.wav, mid.wav, high.wav, vocals.wav, drums.wav, bass.wav, other.wav")
     print("Saved low.wav, mid.wav, high.wav")
 
+
 # Usage
-demucs_hml('/path/songgoeshere.wav')
+if __name__ == '__main__':
+    demucs_hml('/path/songgoeshere.wav')
@@ -1,5 +1,5 @@
 # server.py
-# Flask backend for DJ AI.
+# Quart (async Flask-compatible) backend for DJ AI.
 #
 # Files used (all in ai-dj2/ root):
 #   bpm.py              — BPM detection (librosa)
@@ -13,16 +13,22 @@
 #   line 41: change "from get_bpm import get_bpm" → "from bpm import get_bpm"
 #
 # SETUP:
-#   pip install flask flask-cors
+#   pip install quart quart-cors hypercorn
 #
 # RUN:
 #   cd C:\Users\rheam\OneDrive\Documents\ai-dj2
-#   python server.py
+#   python server.py                              (local dev; DJ_DEBUG=1 for debug)
+#   hypercorn asgi:app --bind 0.0.0.0:5000        (production, see asgi.py)
 
-import os, sys, traceback, threading
+import os, sys, json, queue, asyncio, hashlib, functools, shutil, sqlite3, tempfile, traceback
+from contextlib import closing
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file
-from flask_cors import CORS
+from urllib.parse import quote
+from quart import Quart, Response, request, jsonify, send_file
+from quart_cors import cors
+from werkzeug.utils import secure_filename
 
 
 # ── Path setup ─────────────────────────────────────────────────────
@@ -31,6 +37,11 @@ ROOT = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, ROOT)
 sys.path.insert(0, os.path.join(ROOT, "sections"))
 
+# librosa memoises its filter banks (CQT wavelets, chroma maps, ...) to this
+# directory, so every upload after the first at a given sample rate reuses
+# them.  Must be set before anything imports librosa.
+os.environ.setdefault("LIBROSA_CACHE_DIR", os.path.join(ROOT, "cache", "librosa"))
+
 # ── BPM (librosa — no Essentia) ────────────────────────────────────
 from bpm import get_bpm
 
@@ -58,27 +69,99 @@ except Exception as e:
 
 # ── Mix engine ─────────────────────────────────────────────────────
 try:
-    from many_transitions import make_transition
+    from many_transitions import make_transition, analyse_song
     HAS_MIX = True
 except Exception as e:
     print(f"  [warn] many_transitions: {e}")
     HAS_MIX = False
 
-# ── Flask ──────────────────────────────────────────────────────────
-app = Flask(__name__)
-CORS(app)
+# ── Upload hashing (blake3 if installed, else stdlib blake2b) ──────
+try:
+    from blake3 import blake3
+    HAS_BLAKE3 = True
+except ImportError:
+    HAS_BLAKE3 = False
+
+# ── JSON (orjson if installed, else the stdlib provider) ───────────
+try:
+    import orjson
+    from quart.json.provider import DefaultJSONProvider
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+if HAS_ORJSON:
+    class ORJSONProvider(DefaultJSONProvider):
+        """jsonify / request.get_json via orjson; NumPy scalars serialise as-is."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(
+                obj, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY
+            ).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+# ── Quart ──────────────────────────────────────────────────────────
+# Handlers are async so one slow request never blocks the others: CPU-bound
+# analysis runs via asyncio.to_thread, mixes in MIX_EXECUTOR processes.
+app = cors(Quart(__name__))
+if HAS_ORJSON:
+    app.json = ORJSONProvider(app)
+
+# Uncompressed WAVs are big; reject anything absurd before it hits the disk.
+app.config['MAX_CONTENT_LENGTH'] = 512 * 1024 * 1024
+# Quart's 60 s defaults cut off a big upload or a WAV stream / download on a
+# slow link part way through.  Uploads still get a (generous) limit.
+app.config['BODY_TIMEOUT']     = 10 * 60
+app.config['RESPONSE_TIMEOUT'] = None
 
 UPLOAD_DIR = os.path.join(ROOT, "uploads")
 OUTPUT_DIR = os.path.join(ROOT, "outputs")
+CACHE_DIR  = os.path.join(ROOT, "cache")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR,  exist_ok=True)
 
-# Mix job tracker: job_id → { status, output_file, error, stage }
+# /analyze results keyed by upload content hash.
+ANALYSIS_DB = os.path.join(CACHE_DIR, "analysis.db")
+with closing(sqlite3.connect(ANALYSIS_DB)) as _conn, _conn:
+    _conn.execute("CREATE TABLE IF NOT EXISTS analysis (hash TEXT PRIMARY KEY, json TEXT NOT NULL)")
+
+# Mix job tracker: job_id → { status, output_file, error, stage, pct,
+#                              future, progress, events, cond, pump }
+# A finished job is kept MIX_JOB_TTL seconds for /mix/status and /progress
+# to report its outcome, then dropped.
 mix_jobs = {}
+MIX_JOB_TTL = 10 * 60
+
+# Mix jobs run in worker processes, at most half the cores at once, so
+# concurrent requests queue instead of oversubscribing the CPU.  Workers are
+# reused across jobs, keeping the DEMUCS model loaded between mixes.  They
+# are spawned, not forked: a fork of this threaded server could copy a lock
+# held by another thread into the child, where nothing would release it.
+MIX_CONTEXT  = multiprocessing.get_context("spawn")
+MIX_EXECUTOR = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2),
+                                   mp_context=MIX_CONTEXT)
+
+# BPM detection runs here alongside the chorus/verse pass of each /analyze.
+ANALYZE_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+# Song analyses (BPM, key, sections) for mixing, shared by every job.  Each
+# upload is analysed into it in the background, one file at a time, so the
+# mix job finds it ready instead of redoing it.
+MIX_CACHE_DIR   = os.path.join(OUTPUT_DIR, "analysis_cache")
+WARMUP_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
+
+@functools.lru_cache(maxsize=1)
+def _progress_manager():
+    # Started on first mix, not at import: worker processes import this module.
+    return MIX_CONTEXT.Manager()
 
 
 @app.route('/health')
-def health():
+async def health():
     return jsonify({
         "status": "ok",
         "modules": {
@@ -91,31 +174,83 @@ def health():
     })
 
 
+def _save_upload(stream, filepath):
+    """Copy an upload to filepath in 1 MB chunks, hashing it on the way."""
+    h = blake3() if HAS_BLAKE3 else hashlib.blake2b(digest_size=16)
+    with open(filepath, 'wb') as dest:
+        for block in iter(lambda: stream.read(1 << 20), b''):
+            h.update(block)
+            dest.write(block)
+    return h.hexdigest()
+
+
 @app.route('/analyze', methods=['POST'])
-def analyze():
+async def analyze():
     """
     Upload a WAV → returns BPM, chorus timestamps, verse timestamps.
     Key/Camelot is handled inside many_transitions.py at mix time.
     Expects: multipart/form-data with 'file' field.
     """
-    if 'file' not in request.files:
+    files = await request.files
+    if 'file' not in files:
         return jsonify({"error": "No file provided"}), 400
 
-    f = request.files['file']
-    if not f.filename.lower().endswith('.wav'):
+    f = files['file']
+    if not (f.filename or "").lower().endswith('.wav'):
         return jsonify({"error": "Only .wav files supported"}), 400
 
-    filepath = os.path.join(UPLOAD_DIR, f.filename)
-    f.save(filepath)
+    # Write to a unique temp file and rename it into place, so concurrent
+    # uploads of one name never interleave and /stream never sees a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix='.part')
+    os.close(fd)
+    try:
+        digest = await asyncio.to_thread(_save_upload, f.stream, tmp_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    # Never let a client-chosen name escape UPLOAD_DIR ("../x.wav", "/etc/...").
+    filename = secure_filename(f.filename)
+    if not (filename.lower().endswith('.wav') and len(filename) > len('.wav')):
+        # Nothing usable survived sanitising (e.g. an all non-ASCII name came
+        # back as "wav"), so name the upload after its content hash instead.
+        filename = f"{digest}.wav"
+    filepath = os.path.join(UPLOAD_DIR, filename)
+    os.replace(tmp_path, filepath)
+
+    result = await asyncio.to_thread(_analyze_file, filepath, filename, digest)
+
+    # Queued after the sections pass so the warm-up reuses its in-memory features.
+    if HAS_MIX:
+        WARMUP_EXECUTOR.submit(_warm_mix_cache, filepath)
+
+    return jsonify(result)
 
-    result = {"filename": f.filename}
 
-    # BPM via bpm.py (librosa)
+def _warm_mix_cache(filepath):
+    """Fill MIX_CACHE_DIR for one upload; failures are left for the mix to report."""
     try:
-        result["bpm"] = round(get_bpm(filepath), 2)
-    except Exception as e:
-        result["bpm"]       = None
-        result["bpm_error"] = str(e)
+        analyse_song(filepath, MIX_CACHE_DIR)
+    except Exception:
+        traceback.print_exc()
+
+
+def _analyze_file(filepath, filename, digest):
+    """Run (or fetch from cache) BPM / chorus / verse analysis for one file."""
+    # Same bytes → same analysis, whatever the upload was called.
+    with closing(sqlite3.connect(ANALYSIS_DB, timeout=10)) as conn:
+        row = conn.execute("SELECT json FROM analysis WHERE hash = ?", (digest,)).fetchone()
+    if row:
+        result = json.loads(row[0])
+        result["filename"] = filename
+        return result
+
+    result = {"filename": filename, "bpm": None}
+
+    # BPM via bpm.py (librosa), in parallel with the section detection below.
+    # Chorus and verse stay in this thread, in order: they share one cached
+    # decode + CQT, which concurrent calls would each compute.
+    bpm_future = ANALYZE_EXECUTOR.submit(get_bpm, filepath)
 
     # Chorus timestamps via get_chorus.py
     if HAS_CHORUS:
@@ -137,28 +272,66 @@ def analyze():
     else:
         result["verses"] = []
 
-    return jsonify(result)
+    try:
+        result["bpm"] = round(bpm_future.result(), 2)
+    except Exception as e:
+        result["bpm_error"] = str(e)
+
+    # Only cache complete results so a transient failure is retried next time.
+    if not any(k.endswith("_error") for k in result):
+        with closing(sqlite3.connect(ANALYSIS_DB, timeout=10)) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO analysis (hash, json) VALUES (?, ?)",
+                         (digest, json.dumps(result)))
+
+    return result
+
+
+# ── Mix worker (runs in a MIX_EXECUTOR process) ────────────────────
+def _run_mix_worker(file_a, file_b, out_path, work_dir, progress_q):
+    """Separate stems, build the transition and copy it to out_path.
+
+    Progress goes to progress_q as {stage, pct} dicts.
+    """
+    def report(stage, pct):
+        progress_q.put({"stage": stage, "pct": pct})
+
+    try:
+        report("split", 5)
+        # make_transition handles the rest internally: BPM, key detection,
+        # chorus/verse detection, tight/loose decision and stem separation
+        mix_path = make_transition(file_a, file_b, output_dir=work_dir,
+                                   progress_cb=report, cache_dir=MIX_CACHE_DIR)
+        # Copy under a unique name, then rename, so /stream and /download only
+        # ever see a complete file, even while a re-mix replaces it.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(out_path), suffix='.part')
+        os.close(fd)
+        shutil.copyfile(mix_path, tmp_path)
+        os.replace(tmp_path, out_path)
+    except Exception:
+        traceback.print_exc()
+        raise
+    print(f"\n[server] Mix done → {os.path.basename(out_path)}")
 
 
 # ── /mix/start ─────────────────────────────────────────────────────
 @app.route('/mix/start', methods=['POST'])
-def mix_start():
+async def mix_start():
     """
-    Start a mix job in a background thread (demucs takes time).
+    Queue a mix job on the worker process pool (demucs takes time).
     Body: { file_a, file_b }
     Returns: { job_id }
     Poll /mix/status/<job_id> to check progress.
     """
-    data = request.get_json()
+    data = await request.get_json()
     if not data:
         return jsonify({"error": "No data"}), 400
 
-    file_a = os.path.join(UPLOAD_DIR, data.get("file_a", ""))
-    file_b = os.path.join(UPLOAD_DIR, data.get("file_b", ""))
+    file_a = os.path.join(UPLOAD_DIR, secure_filename(data.get("file_a") or ""))
+    file_b = os.path.join(UPLOAD_DIR, secure_filename(data.get("file_b") or ""))
 
-    if not os.path.exists(file_a):
+    if not os.path.isfile(file_a):
         return jsonify({"error": f"File not found: {data.get('file_a')}"}), 400
-    if not os.path.exists(file_b):
+    if not os.path.isfile(file_b):
         return jsonify({"error": f"File not found: {data.get('file_b')}"}), 400
     if not HAS_MIX:
         return jsonify({"error": "many_transitions.py not loaded"}), 500
@@ -168,68 +341,193 @@ def mix_start():
     out_path = os.path.join(OUTPUT_DIR, out_name)
     work_dir = os.path.join(OUTPUT_DIR, "work", job_id)
 
+    job = mix_jobs.get(job_id)
+    if job and not job["future"].done():
+        return jsonify({"job_id": job_id})   # already queued / running
+
+    progress_q = _progress_manager().Queue()
+    fut = MIX_EXECUTOR.submit(_run_mix_worker, file_a, file_b, out_path,
+                              work_dir, progress_q)
     mix_jobs[job_id] = {
         "status":      "running",
-        "output_file": None,
+        "output_file": out_name,
         "error":       None,
-        "stage":       "Starting..."
+        "stage":       "queued",
+        "pct":         0,
+        "future":      fut,
+        "progress":    progress_q,
+        "events":      [],
+        "cond":        asyncio.Condition(),
     }
+    mix_jobs[job_id]["pump"] = asyncio.create_task(_pump_progress(job_id, mix_jobs[job_id]))
+    return jsonify({"job_id": job_id})
 
-    def run_mix():
-        try:
-            mix_jobs[job_id]["stage"] = "Analyzing BPM and key..."
-            mix_jobs[job_id]["stage"] = "Running DEMUCS on Song 1 (stem separation)..."
-            mix_jobs[job_id]["stage"] = "Running DEMUCS on Song 2 (stem separation)..."
 
-            # make_transition handles everything internally:
-            # BPM, key detection, chorus/verse detection, demucs, tight/loose decision
-            mix_path = make_transition(file_a, file_b, output_dir=work_dir)
+async def _pump_progress(job_id, job):
+    """Copy a job's progress messages from its worker into job["events"].
 
-            import shutil
-            shutil.copy(mix_path, out_path)
+    Once the final "done" / "error" message is out, the job stays listed for
+    MIX_JOB_TTL seconds and is then removed from mix_jobs.
+    """
+    q, fut = job["progress"], job["future"]
+    while True:
+        try:
+            msg = await asyncio.to_thread(q.get, timeout=1.0)
+        except queue.Empty:
+            # Workers put synchronously, so a finished job's queue is complete.
+            if fut.done() and q.empty():
+                break
+            continue
+        await _publish(job, msg)
+
+    if fut.exception() is not None:
+        await _publish(job, {"stage": "error", "pct": 100, "error": str(fut.exception())})
+    else:
+        await _publish(job, {"stage": "done", "pct": 100, "output_file": job["output_file"]})
 
-            mix_jobs[job_id]["status"]      = "done"
-            mix_jobs[job_id]["output_file"] = out_name
-            mix_jobs[job_id]["stage"]       = "Complete"
-            print(f"\n[server] Mix done → {out_name}")
+    await asyncio.sleep(MIX_JOB_TTL)
+    # A re-run of the same pair may have replaced this entry meanwhile.
+    if mix_jobs.get(job_id) is job:
+        del mix_jobs[job_id]
 
-        except Exception as e:
-            traceback.print_exc()
-            mix_jobs[job_id]["status"] = "error"
-            mix_jobs[job_id]["error"]  = str(e)
-            mix_jobs[job_id]["stage"]  = "Failed"
 
-    threading.Thread(target=run_mix, daemon=True).start()
-    return jsonify({"job_id": job_id})
+async def _publish(job, msg):
+    job["stage"] = msg["stage"]
+    job["pct"]   = msg["pct"]
+    job["events"].append(msg)
+    async with job["cond"]:
+        job["cond"].notify_all()
 
 
 # ── /mix/status/<job_id> ───────────────────────────────────────────
 @app.route('/mix/status/<job_id>')
-def mix_status(job_id):
+async def mix_status(job_id):
     """Poll this every few seconds to check if the mix is ready."""
     job = mix_jobs.get(job_id)
     if not job:
         return jsonify({"error": "Unknown job"}), 404
-    return jsonify(job)
 
+    fut = job["future"]
+    if not fut.done():
+        status, error, stage = "running", None, job["stage"]
+    elif fut.exception() is not None:
+        status, error, stage = "error", str(fut.exception()), "Failed"
+    else:
+        status, error, stage = "done", None, "Complete"
+
+    return jsonify({
+        "status":      status,
+        "output_file": job["output_file"] if status == "done" else None,
+        "error":       error,
+        "stage":       stage,
+        "pct":         100 if fut.done() else job["pct"],
+    })
+
+
+# ── /progress/<job_id> ─────────────────────────────────────────────
+@app.route('/progress/<job_id>')
+async def progress(job_id):
+    """
+    Server-sent events for a mix job: one {stage, pct} message per pipeline
+    step, ending with a "done" or "error" message.  Late subscribers get the
+    steps so far replayed first.
+    """
+    job = mix_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
 
-@app.route('/stream/<folder>/<filename>')
-def stream(folder, filename):
-    """Stream a WAV file for browser playback."""
+    async def events():
+        sent = 0
+        while True:
+            async with job["cond"]:
+                try:
+                    await asyncio.wait_for(
+                        job["cond"].wait_for(lambda: len(job["events"]) > sent),
+                        timeout=15,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            new = job["events"][sent:]
+            if not new:
+                yield ": ping\n\n"           # heartbeat keeps proxies from closing
+                continue
+            for msg in new:
+                yield f"data: {app.json.dumps(msg)}\n\n"
+            sent += len(new)
+            if new[-1]["stage"] in ("done", "error"):
+                return
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.timeout = None     # stream for as long as the job runs
+    return response
+
+
+# ── File delivery ──────────────────────────────────────────────────
+# Behind a reverse proxy, set DJ_SENDFILE=nginx (X-Accel-Redirect) or
+# DJ_SENDFILE=apache (X-Sendfile) and the proxy sends the WAV bytes itself
+# with sendfile(2); Python only writes headers.  nginx needs, e.g.:
+#   location /_protected_uploads/ { internal; alias <UPLOAD_DIR>/; }
+#   location /_protected_outputs/ { internal; alias <OUTPUT_DIR>/; }
+# Unset (dev server), files go out through send_file as before.
+SENDFILE_MODE = os.environ.get("DJ_SENDFILE", "").lower()
+
+
+def _proxy_sendfile(folder, filename, path, as_attachment=False):
+    """Return a header-only response for the proxy to fill, or None."""
+    if SENDFILE_MODE not in ("nginx", "apache"):
+        return None
+    response = Response("", mimetype='audio/wav')
+    if SENDFILE_MODE == "nginx":
+        response.headers['X-Accel-Redirect'] = f"/_protected_{folder}/{quote(filename)}"
+    else:
+        response.headers['X-Sendfile'] = path
+    if as_attachment:
+        # As send_file does: a quoted ASCII fallback plus the RFC 5987 UTF-8 form.
+        ascii_name = filename.encode('ascii', 'ignore').decode().replace('\\', '').replace('"', '')
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename="{ascii_name}"; '
+            f"filename*=UTF-8''{quote(filename, safe='')}"
+        )
+    return response
+
+
+@app.route('/stream/<folder>/<filename>', methods=['GET', 'HEAD'])
+async def stream(folder, filename):
+    """
+    Stream a WAV file for browser playback.
+    HEAD gets the same headers without the body, so a player can see
+    Accept-Ranges / Content-Length and then fetch only the byte ranges it
+    seeks to.
+    """
+    folder = "uploads" if folder == "uploads" else "outputs"
     base = UPLOAD_DIR if folder == "uploads" else OUTPUT_DIR
+    filename = secure_filename(filename)
     path = os.path.join(base, filename)
     if not os.path.exists(path):
         return jsonify({"error": "File not found"}), 404
-    return send_file(path, mimetype='audio/wav', conditional=True)
+    response = _proxy_sendfile(folder, filename, path)
+    if response is None:
+        response = await send_file(path, mimetype='audio/wav', conditional=True)
+    response.headers['Accept-Ranges'] = 'bytes'
+    # Names are reused when a song is re-uploaded or re-mixed, so let the
+    # browser cache but revalidate (a cheap 304 via the ETag) on each use.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 @app.route('/download/<filename>')
-def download(filename):
+async def download(filename):
     """Download a finished mix file."""
+    filename = secure_filename(filename)
     path = os.path.join(OUTPUT_DIR, filename)
     if not os.path.exists(path):
         return jsonify({"error": "Not found"}), 404
-    return send_file(path, as_attachment=True)
+    # conditional=True answers Range / If-None-Match requests without
+    # re-sending the whole file.
+    response = _proxy_sendfile("outputs", filename, path, as_attachment=True)
+    if response is None:
+        response = await send_file(path, as_attachment=True, conditional=True, max_age=0)
+    return response
 
 
 if __name__ == '__main__':
@@ -247,4 +545,5 @@ if __name__ == '__main__':
     print(f"  Running → http://localhost:5000")
     print("="*50 + "\n")
 
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    # Dev server only; production goes through asgi.py.
+    app.run(debug=os.environ.get("DJ_DEBUG") == "1", port=5000, host='0.0.0.0')
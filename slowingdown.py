@@ -2,6 +2,7 @@ import pyrubberband as pyrb
 import numpy as np
 import librosa
 import soundfile as sf
+import soxr
 from scipy.io.wavfile import write as wav_write
 import os
 
@@ -18,12 +19,18 @@ def full_mix(filepath1, filepath2, transition_start, output_path, seconds_per_bp
         filepath2:        second song
         transition_start: second where transition begins in song2
         output_path:      where to save final mix
-        seconds_per_bpm:  controls how long the slowdown takes per BPM difference
+        seconds_per_bpm:  base slowdown time per BPM of difference; it grows by
+                          0.3 s for each BPM of difference on top of this
     """
 
-    # --- 1. detect BPMs ---
-    y1_mono, sr1 = librosa.load(filepath1, sr=None)
-    y2_mono, sr2 = librosa.load(filepath2, sr=None)
+    # --- 1. load each file once; BPM runs on a mono downmix ---
+    # soundfile straight to float32 (frames, channels); .T is a view giving
+    # the (channels, samples) layout used below, mono files included
+    y1, sr1 = sf.read(filepath1, dtype='float32', always_2d=True)
+    y2, sr2 = sf.read(filepath2, dtype='float32', always_2d=True)
+    y1, y2  = y1.T, y2.T
+    y1_mono = y1.mean(axis=0)
+    y2_mono = y2.mean(axis=0)
 
     bpm1 = float(librosa.beat.beat_track(y=y1_mono, sr=sr1, start_bpm=128)[0])
     bpm2 = float(librosa.beat.beat_track(y=y2_mono, sr=sr2, start_bpm=128)[0])
@@ -35,17 +42,15 @@ def full_mix(filepath1, filepath2, transition_start, output_path, seconds_per_bp
     print(f"Song 2 BPM: {bpm2:.1f}")
 
     bpm_diff         = abs(bpm1 - bpm2)
-    seconds_per_bpm  = 5 + (bpm_diff * 0.3)
+    seconds_per_bpm  = seconds_per_bpm + (bpm_diff * 0.3)
     slowdown_duration = bpm_diff * seconds_per_bpm
     curve_tension    = 1.0 / (1.0 + bpm_diff * 0.1)
     print(f"BPM difference: {bpm_diff:.1f} — slowdown duration: {slowdown_duration:.1f}s")
 
-    # --- 2. load stereo ---
-    y1, sr1 = librosa.load(filepath1, sr=None, mono=False)
-    y2, sr2 = librosa.load(filepath2, sr=None, mono=False)
-
+    # --- 2. match sample rates ---
     if sr1 != sr2:
-        y2 = librosa.resample(y2, orig_sr=sr2, target_sr=sr1)
+        # soxr resamples all channels of a (frames, channels) array in one pass
+        y2 = soxr.resample(y2.T, sr2, sr1, quality='HQ').T
     sr = sr1
 
     transition_sample = int(transition_start * sr)
@@ -57,58 +62,82 @@ def full_mix(filepath1, filepath2, transition_start, output_path, seconds_per_bp
     # --- 3. stretch transition portion to match song1's BPM ---
     rate = bpm1 / bpm2
     print(f"Stretching transition by rate {rate:.4f} to match {bpm1:.1f} BPM")
-    if transition.ndim == 1:
-        transition_stretched = librosa.effects.time_stretch(transition, rate=rate)
-    else:
-        transition_stretched = np.stack([
-            librosa.effects.time_stretch(ch, rate=rate) for ch in transition
-        ])
+    # one call for all channels: librosa stretches along the last axis
+    transition_stretched = librosa.effects.time_stretch(transition, rate=rate)
 
     # --- 4. gradual slowdown on post portion ---
     slowdown_samples = min(int(slowdown_duration * sr), post.shape[-1])
 
     start_rate = bpm1 / bpm2
     end_rate   = 1.0
-    n_points   = 1000
+    n_points   = 64     # rubberband interpolates between time-map points anyway
     t          = np.linspace(0, 1, n_points)
-    rates      = start_rate + (end_rate - start_rate) * (1 - np.cos(t * np.pi * curve_tension)) / 2
 
-    input_samples  = np.linspace(0, slowdown_samples, n_points)
-    inv_rates      = 1.0 / rates
-    output_samples = np.cumsum(inv_rates) / np.sum(inv_rates) * slowdown_samples
-    time_map       = [(int(i), int(o)) for i, o in zip(input_samples, output_samples)]
+    # rate(t) = start + (end - start)(1 - cos(pi*k*t))/2, k = curve_tension.
+    # Output position is the normalised integral of 1/rate, which has a closed
+    # form: with h = pi*k*t/2,  integral ∝ atan(sqrt(end/start) * tan(h)).
+    # (atan2 keeps it finite at h = pi/2.)
+    half_theta     = t * (np.pi * curve_tension / 2)
+    scale          = np.sqrt(end_rate / start_rate)
+    warp           = np.arctan2(scale * np.sin(half_theta), np.cos(half_theta))
+
+    input_samples  = t * slowdown_samples
+    output_samples = warp / warp[-1] * slowdown_samples
+    # truncate both columns at once and box to Python ints only at the pyrb
+    # boundary (same values as int() per element)
+    time_map       = list(zip(input_samples.astype(np.int64).tolist(),
+                              output_samples.astype(np.int64).tolist()))
 
     slowdown_region = post[..., :slowdown_samples]
     tail            = post[..., slowdown_samples:]
 
     print("Applying gradual slowdown...")
-    if slowdown_region.ndim == 1:
-        slowed = pyrb.timemap_stretch(slowdown_region, sr, time_map)
-    else:
-        slowed = np.stack([
-            pyrb.timemap_stretch(ch, sr, time_map) for ch in slowdown_region
-        ])
+    # one rubberband run for all channels: pyrb takes (samples, channels)
+    slowed = pyrb.timemap_stretch(slowdown_region.T, sr, time_map).T
 
     # --- 5. combine everything ---
     print("Combining song1 + transition + slowed post + tail...")
-    post_processed = np.concatenate([slowed, tail], axis=-1)
-    output = np.concatenate([y1, transition_stretched, post_processed], axis=-1)
-    output = output / np.max(np.abs(output))
-
-    if output.ndim == 1:
-        sf.write(output_path, output, sr)
-    else:
-        sf.write(output_path, output.T, sr)
+    # peak-normalise while assembling: take each piece's peak, then write
+    # every piece pre-scaled into one output buffer (no concatenated copy,
+    # no separate whole-mix abs/divide passes)
+    pieces = [y1, transition_stretched, slowed, tail]
+    peak   = max(max(p.max(), -p.min()) for p in pieces if p.size)
+    norm   = 1.0 / peak if peak > 0 else 1.0
+    output = np.empty((y1.shape[0], sum(p.shape[-1] for p in pieces)), dtype=np.float32)
+    pos = 0
+    for p in pieces:
+        np.multiply(p, norm, out=output[:, pos:pos + p.shape[-1]])
+        pos += p.shape[-1]
+
+    sf.write(output_path, output.T, sr)
 
     print(f"Saved to: {output_path}")
     return output_path
 
 
-# Usage
-full_mix(
-    '/Users/siddarvind/Downloads/fameisagun.wav',
-    '/Users/siddarvind/Downloads/thinkingaboutyou.wav',
-    transition_start=41.0,          # seconds into song2 where transition begins
-    output_path='/Users/siddarvind/Downloads/full_mix.wav',
-    seconds_per_bpm=5
-)
+# Usage:
+#   python slowingdown.py fameisagun.wav thinkingaboutyou.wav full_mix.wav \
+#       --transition-start 41.0
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Mix song2 into song1, then ease song2 back to its own BPM."
+    )
+    parser.add_argument('song1', help="first song (.wav)")
+    parser.add_argument('song2', help="second song (.wav)")
+    parser.add_argument('output', help="where to save the final mix (.wav)")
+    parser.add_argument('--transition-start', type=float, required=True,
+                        help="seconds into song2 where the transition begins")
+    parser.add_argument('--seconds-per-bpm', type=float, default=5,
+                        help="base slowdown time per BPM of difference "
+                             "(plus 0.3 s per BPM of difference)")
+    args = parser.parse_args()
+
+    full_mix(
+        args.song1,
+        args.song2,
+        transition_start=args.transition_start,
+        output_path=args.output,
+        seconds_per_bpm=args.seconds_per_bpm,
+    )
@@ -0,0 +1,48 @@
+"""Tests for the many_transitions mix builders."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+mt = pytest.importorskip("many_transitions")
+
+PHRASE = 1000
+
+
+def _stems(n):
+    """Return (low, mid, high) stereo stems of n samples with distinct values."""
+    return tuple(np.full((2, n), v, dtype=np.float32) for v in (0.1, 0.2, 0.3))
+
+
+def _fallback_kwargs(window):
+    y1 = np.zeros((2, 5 * PHRASE), dtype=np.float32)
+    low1, mid1, high1 = _stems(window)
+    low2, mid2, high2 = _stems(6 * PHRASE)
+    return dict(
+        y1=y1,
+        low1=low1, mid1=mid1, high1=high1,
+        low2=low2, mid2=mid2, high2=high2,
+        s1_v1_start=0,
+        trans_start=2 * PHRASE,
+        s2_start=PHRASE,
+        phrase_samples=PHRASE,
+        s2_end_sample=6 * PHRASE,
+    )
+
+
+def test_tight_fallback_builds_from_two_phrase_window():
+    # make_transition reads two phrases of Song 1 stems for the fallback.
+    mix = mt._build_tight_fallback(**_fallback_kwargs(2 * PHRASE))
+
+    # Song 1 up to trans_start, two blend phrases, then Song 2 to its end.
+    assert mix.shape == (2, 2 * PHRASE + 2 * PHRASE + (6 * PHRASE - 3 * PHRASE))
+    # Phase B opens on Song 1 mids at full plus Song 2 lows.
+    np.testing.assert_allclose(mix[:, 3 * PHRASE], 0.2 + 0.1)
+
+
+def test_tight_fallback_rejects_one_phrase_window():
+    with pytest.raises(ValueError, match="too short"):
+        mt._build_tight_fallback(**_fallback_kwargs(PHRASE))